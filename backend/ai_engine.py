@@ -1,8 +1,10 @@
 import os
 import time
 import json
+import asyncio
 import google.generativeai as genai
 from dotenv import load_dotenv
+from analysis_cache import AnalysisCache
 
 load_dotenv()
 
@@ -10,56 +12,212 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 
+MODEL_NAME = 'gemini-flash-latest'
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", 4))
+# Chunks of one long video analysed at the same time
+MAX_PARALLEL_CHUNKS = int(os.getenv("MAX_PARALLEL_CHUNKS", 3))
+MAX_HIGHLIGHTS = 5
+# Gemini file processing poll: starts at POLL_INITIAL_DELAY, doubles up to POLL_MAX_DELAY
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 30.0
+POLL_TIMEOUT = float(os.getenv("GEMINI_PROCESSING_TIMEOUT", 1800))
+
+HIGHLIGHTS_PROMPT = """
+            Analyze this video and identify 3-5 most engaging or important highlights that would be suitable for a social media teaser.
+            For each highlight, provide the start and end timestamps in "MM:SS" format, and a brief description.
+            
+            Return the response ONLY as a valid JSON list of objects with the following structure:
+            [
+                {"start": "MM:SS", "end": "MM:SS", "description": "Brief description"}
+            ]
+            Do not include any markdown formatting or other text.
+            """
+
+CHUNK_PROMPT = """
+            This clip is one part of a longer video. Identify up to 3 of its most engaging or important moments
+            that would be suitable for a social media teaser, and score each from 1 (weak) to 10 (must include).
+            Provide the start and end timestamps relative to the start of this clip in "MM:SS" format, and a brief description.
+            
+            Return the response ONLY as a valid JSON list of objects with the following structure:
+            [
+                {"start": "MM:SS", "end": "MM:SS", "description": "Brief description", "score": 7}
+            ]
+            Return an empty list if nothing in the clip stands out.
+            Do not include any markdown formatting or other text.
+            """
+
+async def _print_log(message: str, level: str = "info"):
+    print(message)
+
 class AIEngine:
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-flash-latest')
+    def __init__(self, model_name: str = MODEL_NAME, cache: AnalysisCache = None, client=genai,
+                 max_concurrent: int = MAX_CONCURRENT_ANALYSES):
+        """
+        client is the genai module by default; any object with upload_file,
+        get_file and GenerativeModel works, so tests can pass a local fake.
+        """
+        self.model_name = model_name
+        self.client = client
+        self.model = client.GenerativeModel(model_name)
+        self.cache = cache if cache is not None else AnalysisCache()
+        self.max_concurrent = max_concurrent
+        self._semaphore = None
+
+    def _remote_slot(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
 
-    def upload_file(self, path: str):
-        print(f"Uploading file: {path}")
-        video_file = genai.upload_file(path=path)
+    async def upload_file(self, path: str, log=_print_log):
+        """Uploads a file and waits, without blocking the loop, until Gemini has processed it."""
+        await log(f"Agent Qazi: Uploading {os.path.basename(path)} to Gemini...")
+        video_file = await asyncio.to_thread(self.client.upload_file, path=path)
         print(f"Completed upload: {video_file.uri}")
-        
-        # Wait for file to be active
+
+        await log("Agent Qazi: Waiting for Gemini to process the video...")
+        delay = POLL_INITIAL_DELAY
+        waited = 0.0
         while video_file.state.name == "PROCESSING":
-            print("Processing video...", end="\r")
-            time.sleep(5)
-            video_file = genai.get_file(video_file.name)
-            
+            if waited >= POLL_TIMEOUT:
+                raise TimeoutError(f"Gemini did not finish processing {video_file.name} in {POLL_TIMEOUT:.0f}s")
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, POLL_MAX_DELAY)
+            video_file = await asyncio.to_thread(self.client.get_file, video_file.name)
+
         if video_file.state.name == "FAILED":
             raise ValueError("Video processing failed")
-            
-        print(f"\nFile is active: {video_file.name}")
+
+        print(f"File is active: {video_file.name}")
         return video_file
 
-    async def analyze_video(self, video_path: str):
+    async def analyze_video(self, video_path: str, log=_print_log, prepare_upload=None):
         """
         Uploads video to Gemini and analyzes it to find highlights.
         Returns a list of timestamps (start, end) and descriptions.
+        log is an async callable(message, level) used to report each stage.
+        prepare_upload is an optional async callable returning the file to
+        upload instead of video_path (e.g. an analysis proxy); it only runs
+        on a cache miss.
         """
         try:
-            video_file = self.upload_file(video_path)
-            
-            prompt = """
-            Analyze this video and identify 3-5 most engaging or important highlights that would be suitable for a social media teaser.
-            For each highlight, provide the start and end timestamps in "MM:SS" format, and a brief description.
-            
-            Return the response ONLY as a valid JSON list of objects with the following structure:
-            [
-                {"start": "MM:SS", "end": "MM:SS", "description": "Brief description"}
-            ]
-            Do not include any markdown formatting or other text.
-            """
-            
-            response = self.model.generate_content([video_file, prompt])
-            print("Gemini Response:", response.text)
-            
-            return self._parse_timestamps(response.text)
+            prompt = HIGHLIGHTS_PROMPT
+            cache_key = await asyncio.to_thread(self.cache.key, video_path, prompt, self.model_name)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                await log("Agent Qazi: Reusing cached analysis for this video")
+                return cached
+
+            upload_path = await prepare_upload() if prepare_upload else video_path
+            response_text = await self._generate(upload_path, prompt, log)
+
+            await log("Agent Qazi: Parsing highlights...")
+            highlights = self._parse_timestamps(response_text)
+            if highlights:
+                self.cache.put(cache_key, highlights)
+            return highlights
             
         except Exception as e:
             print(f"Error in AI analysis: {e}")
+            await log(f"Agent Qazi: Analysis failed: {e}", "error")
+            return []
+
+    async def _generate(self, upload_path: str, prompt: str, log=_print_log) -> str:
+        """Uploads a file and runs the prompt on it within the remote concurrency cap."""
+        semaphore = self._remote_slot()
+        if semaphore.locked():
+            await log("Agent Qazi: Waiting for a free Gemini analysis slot...")
+        async with semaphore:
+            video_file = await self.upload_file(upload_path, log)
+
+            await log("Agent Qazi: Asking Gemini for highlights...")
+            started = time.monotonic()
+            response = await asyncio.to_thread(self.model.generate_content, [video_file, prompt])
+            print("Gemini Response:", response.text)
+            await log(f"Agent Qazi: Gemini responded in {time.monotonic() - started:.1f}s")
+        return response.text
+
+    async def analyze_video_chunked(self, video_path: str, prepare_chunks, log=_print_log,
+                                    max_parallel: int = MAX_PARALLEL_CHUNKS, max_highlights: int = MAX_HIGHLIGHTS,
+                                    cache_variant: str = "chunks"):
+        """
+        Map-reduce analysis for long videos. prepare_chunks is an async
+        callable returning [{"path", "start", "end"}] time windows of the
+        source; each window is analysed concurrently, chunk-relative
+        timestamps are offset back onto the source timeline, and the
+        results are merged and re-ranked into one highlight list.
+        cache_variant separates results of different chunking strategies.
+        """
+        try:
+            cache_key = await asyncio.to_thread(
+                self.cache.key, video_path, CHUNK_PROMPT, f"{self.model_name}|{cache_variant}"
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                await log("Agent Qazi: Reusing cached analysis for this video")
+                return cached
+
+            chunks = await prepare_chunks()
+            await log(f"Agent Qazi: Analysing {len(chunks)} chunks, {max_parallel} at a time...")
+            chunk_slot = asyncio.Semaphore(max_parallel)
+
+            async def analyze_chunk(index: int, chunk: dict):
+                window = f"{self._format_time(chunk['start'])}-{self._format_time(chunk['end'])}"
+                try:
+                    async with chunk_slot:
+                        response_text = await self._generate(chunk['path'], CHUNK_PROMPT, log)
+                    highlights = self._parse_timestamps(response_text, offset=chunk['start'])
+                except Exception as e:
+                    print(f"Error analysing chunk {index}: {e}")
+                    await log(f"Agent Qazi: Chunk {index + 1} ({window}) failed: {e}", "warning")
+                    return []
+                await log(f"Agent Qazi: Chunk {index + 1}/{len(chunks)} ({window}) done, "
+                          f"{len(highlights)} candidate highlights")
+                for h in highlights:
+                    await log(f"    {h['description']} ({h['start']}s - {h['end']}s, score {h.get('score', '-')})")
+                return highlights
+
+            candidates = []
+            tasks = [asyncio.create_task(analyze_chunk(i, chunk)) for i, chunk in enumerate(chunks)]
+            for finished in asyncio.as_completed(tasks):
+                candidates.extend(await finished)
+
+            highlights = self._merge_highlights(candidates, max_highlights)
+            if highlights:
+                self.cache.put(cache_key, highlights)
+            return highlights
+
+        except Exception as e:
+            print(f"Error in chunked AI analysis: {e}")
+            await log(f"Agent Qazi: Analysis failed: {e}", "error")
             return []
 
-    def _parse_timestamps(self, response_text: str):
+    def _merge_highlights(self, candidates: list, max_highlights: int = MAX_HIGHLIGHTS):
+        """
+        Keeps the best-scoring non-overlapping candidates, returned in
+        timeline order.
+        """
+        selected = []
+        for candidate in sorted(candidates, key=lambda h: h.get('score', 0), reverse=True):
+            if len(selected) >= max_highlights:
+                break
+            if any(candidate['start'] < h['end'] and h['start'] < candidate['end'] for h in selected):
+                continue
+            selected.append(candidate)
+        return sorted(selected, key=lambda h: h['start'])
+
+    def _format_time(self, seconds: float) -> str:
+        seconds = int(seconds)
+        if seconds >= 3600:
+            return f"{seconds // 3600}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+        return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+    def _parse_timestamps(self, response_text: str, offset: float = 0):
+        """
+        Parses the model's JSON highlight list into seconds. offset is added
+        to every timestamp, for responses about a window of the source.
+        """
         try:
             # Clean up potential markdown code blocks
             text = response_text.replace("```json", "").replace("```", "").strip()
@@ -68,13 +226,16 @@ class AIEngine:
             # Convert MM:SS to seconds
             highlights = []
             for item in data:
-                start_sec = self._time_to_seconds(item['start'])
-                end_sec = self._time_to_seconds(item['end'])
-                highlights.append({
-                    "start": start_sec,
-                    "end": end_sec,
+                start_sec = self._time_to_seconds(item['start']) + offset
+                end_sec = self._time_to_seconds(item['end']) + offset
+                highlight = {
+                    "start": round(start_sec, 3),
+                    "end": round(end_sec, 3),
                     "description": item['description']
-                })
+                }
+                if 'score' in item:
+                    highlight['score'] = item['score']
+                highlights.append(highlight)
             return highlights
         except json.JSONDecodeError:
             print("Failed to parse JSON from AI response")
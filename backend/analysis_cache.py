@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from typing import Optional
+
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "data/analysis_cache")
+ANALYSIS_CACHE_MAX_MB = float(os.getenv("ANALYSIS_CACHE_MAX_MB", 256))
+# Remembered content hashes kept beyond those of files that changed or were deleted
+ANALYSIS_HASH_MEMO_MAX = int(os.getenv("ANALYSIS_HASH_MEMO_MAX", 10000))
+# Memo eviction stats every memo, so it runs at most this often (seconds)
+ANALYSIS_HASH_MEMO_EVICT_INTERVAL = float(os.getenv("ANALYSIS_HASH_MEMO_EVICT_INTERVAL", 300))
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def hash_file(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """SHA-256 of a file, read in chunks so large videos never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Content-addressed on-disk cache of parsed highlight lists.
+
+    Entries are keyed by the video's content hash plus the prompt and
+    model name, and evicted least-recently-used once the cache grows past
+    max_mb. Content hashes are remembered per (path, size, mtime) so a
+    cache hit doesn't re-read the video; at most once per
+    memo_evict_interval, a pass drops memos of files that changed or no
+    longer exist, and the least recently used ones beyond max_memos.
+    """
+
+    def __init__(self, cache_dir: str = ANALYSIS_CACHE_DIR, max_mb: float = ANALYSIS_CACHE_MAX_MB,
+                 max_memos: int = ANALYSIS_HASH_MEMO_MAX,
+                 memo_evict_interval: float = ANALYSIS_HASH_MEMO_EVICT_INTERVAL):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_memos = max_memos
+        self.memo_evict_interval = memo_evict_interval
+        self._memos_evicted_at = float("-inf")
+        self._hash_dir = os.path.join(cache_dir, "hashes")
+        self._lock = threading.Lock()
+        os.makedirs(self._hash_dir, exist_ok=True)
+
+    def _memo_path(self, path: str) -> str:
+        stats = os.stat(path)
+        fingerprint = f"{os.path.abspath(path)}:{stats.st_size}:{stats.st_mtime_ns}"
+        return os.path.join(self._hash_dir, hashlib.sha1(fingerprint.encode()).hexdigest())
+
+    def _read_memo(self, memo_path: str) -> Optional[str]:
+        try:
+            with open(memo_path) as f:
+                content_hash = f.readline().strip()
+        except FileNotFoundError:
+            return None
+        # Touch the memo so eviction is least-recently-used
+        try:
+            os.utime(memo_path)
+        except FileNotFoundError:
+            pass
+        return content_hash or None
+
+    def _write_atomic(self, path: str, write):
+        """Writes path via a temp file of its own, so concurrent writers never share one."""
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _write_memo(self, path: str, content_hash: str):
+        # The path is kept on the second line so eviction can tell when the memo went stale
+        self._write_atomic(self._memo_path(path), lambda f: f.write(f"{content_hash}\n{os.path.abspath(path)}\n"))
+        self._evict_memos()
+
+    def remember_hash(self, path: str, content_hash: str):
+        """Record a SHA-256 computed elsewhere (e.g. during upload)."""
+        self._write_memo(path, content_hash)
+
+    def known_hash(self, path: str) -> Optional[str]:
+        """The remembered content hash of path, without hashing it on a miss."""
+        return self._read_memo(self._memo_path(path))
+
+    def content_hash(self, path: str) -> str:
+        content_hash = self._read_memo(self._memo_path(path))
+        if content_hash is None:
+            content_hash = hash_file(path)
+            self._write_memo(path, content_hash)
+        return content_hash
+
+    def key(self, video_path: str, prompt: str, model_name: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.content_hash(video_path).encode())
+        digest.update(b"\0" + model_name.encode())
+        digest.update(b"\0" + prompt.encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[list]:
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                highlights = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Touch the entry so eviction is least-recently-used
+        os.utime(path)
+        return highlights
+
+    def put(self, key: str, highlights: list):
+        self._write_atomic(self._entry_path(key), lambda f: json.dump(highlights, f))
+        self._evict()
+
+    def _evict_memos(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._memos_evicted_at < self.memo_evict_interval:
+                return
+            self._memos_evicted_at = now
+            memos = []
+            for name in os.listdir(self._hash_dir):
+                if name.startswith(".tmp_"):
+                    continue
+                memo_path = os.path.join(self._hash_dir, name)
+                try:
+                    stats = os.stat(memo_path)
+                    with open(memo_path) as f:
+                        f.readline()
+                        path = f.readline().strip()
+                except FileNotFoundError:
+                    continue
+                stale = False
+                if path:
+                    try:
+                        stale = self._memo_path(path) != memo_path
+                    except FileNotFoundError:
+                        stale = True
+                if stale:
+                    try:
+                        os.remove(memo_path)
+                    except FileNotFoundError:
+                        pass
+                else:
+                    memos.append((stats.st_mtime, memo_path))
+
+            for _, memo_path in sorted(memos)[:max(0, len(memos) - self.max_memos)]:
+                try:
+                    os.remove(memo_path)
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self):
+        self._evict_memos()
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stats = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stats.st_mtime, stats.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
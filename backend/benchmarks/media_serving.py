@@ -0,0 +1,154 @@
+"""
+Concurrent range-request throughput of the media server against a plain
+StaticFiles mount, on the same file and the same uvicorn setup.
+
+    cd backend
+    pip install -r requirements-dev.txt
+    python benchmarks/media_serving.py --clients 64 --seconds 10 --range-kb 512
+
+Prints one JSON object with requests/s, MB/s and latency percentiles per
+target. The server runs in a separate process so the load generator
+doesn't share its GIL.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+
+from media_server import MediaServer, ClientLimiter
+
+
+def make_app(directory: str) -> FastAPI:
+    app = FastAPI()
+    # Every benchmark client shares one address, so per-client limits are off
+    media_server = MediaServer(limiter=ClientLimiter(max_streams=0, bandwidth=0))
+
+    @app.get("/media/{name}")
+    async def media(name: str, request: Request):
+        return await media_server.response(request, os.path.join(directory, name))
+
+    app.mount("/static", StaticFiles(directory=directory), name="static")
+    return app
+
+
+def serve(directory: str, port: int):
+    uvicorn.run(make_app(directory), host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_load(url: str, size: int, clients: int, seconds: float, range_bytes: int, seed: int) -> dict:
+    latencies = []
+    transferred = 0
+    errors = 0
+    deadline = time.monotonic() + seconds
+
+    async def client(rng: random.Random):
+        nonlocal transferred, errors
+        async with httpx.AsyncClient(timeout=30) as http:
+            while time.monotonic() < deadline:
+                start = rng.randrange(0, max(1, size - range_bytes))
+                started = time.perf_counter()
+                response = await http.get(url, headers={"Range": f"bytes={start}-{start + range_bytes - 1}"})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code == 206 and len(response.content) == range_bytes:
+                    transferred += len(response.content)
+                else:
+                    errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(random.Random(seed + i)) for i in range(clients)))
+    elapsed = time.monotonic() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "mb_per_second": round(transferred / elapsed / (1024 * 1024), 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+        },
+    }
+
+
+async def wait_for_server(base_url: str, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            try:
+                await http.get(base_url + "/docs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("Benchmark server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file-mb", type=int, default=256)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--range-kb", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="media_bench_")
+    path = os.path.join(directory, "video.mp4")
+    with open(path, "wb") as f:
+        for _ in range(args.file_mb):
+            f.write(os.urandom(1024 * 1024))
+    size = os.path.getsize(path)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = multiprocessing.Process(target=serve, args=(directory, port), daemon=True)
+    server.start()
+    try:
+        asyncio.run(wait_for_server(base_url))
+        results = {
+            "file_mb": args.file_mb,
+            "clients": args.clients,
+            "seconds": args.seconds,
+            "range_kb": args.range_kb,
+            "targets": {},
+        }
+        for name, url in (("media_server", f"{base_url}/media/video.mp4"),
+                          ("static_files", f"{base_url}/static/video.mp4")):
+            results["targets"][name] = asyncio.run(
+                run_load(url, size, args.clients, args.seconds, args.range_kb * 1024, args.seed)
+            )
+        print(json.dumps(results, indent=2))
+    finally:
+        server.terminate()
+        server.join()
+        os.remove(path)
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
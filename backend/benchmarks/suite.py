@@ -0,0 +1,453 @@
+"""
+Benchmark suite for the processing and library hot paths, meant to be
+run on two commits and compared.
+
+    cd backend
+    pip install -r requirements-dev.txt
+    python benchmarks/suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/suite.py --baseline before.json --output after.json
+
+Sources are generated with ffmpeg's lavfi testsrc2 and sine filters over
+every combination of --durations, --resolutions and --codecs, so each
+run times identical input. They are kept in --workdir and reused when it
+is given. Sections (--sections, all by default):
+
+    metadata    MetadataExtractor.extract_metadata
+    cut         cut_video and smart_cut_video of one clip
+    concat      concatenate_videos of the cut clips
+    highlights  process_highlights per pipeline mode, and with a warm segment cache
+    pipeline    process_video_task end to end, with per-stage timings
+    library     GET /videos with 10, 1k and 10k stored files
+    fanout      ConnectionManager broadcast (see ws_fanout.py)
+
+Gemini is replaced by a local fake client that answers with highlights
+at fixed fractions of the video, so the pipeline runs offline. Sections
+needing ffmpeg are skipped when it isn't installed. Prints one JSON
+object (timings in seconds, median and min of --repeat runs); with
+--baseline, each timing also gets its change against the earlier run.
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import statistics
+import subprocess
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+import ffmpeg
+import httpx
+
+SECTIONS = ["metadata", "cut", "concat", "highlights", "pipeline", "library", "fanout"]
+FFMPEG_SECTIONS = {"metadata", "cut", "concat", "highlights", "pipeline"}
+# Codec name -> ffmpeg encoder used to generate the source
+ENCODERS = {"h264": "libx264", "hevc": "libx265", "mpeg4": "mpeg4"}
+SOURCE_FPS = 30
+# Highlights as fractions of the source duration, used by every section
+HIGHLIGHT_FRACTIONS = [(0.10, 0.20), (0.40, 0.50), (0.70, 0.80)]
+LIBRARY_SIZES = [10, 1000, 10000]
+LIBRARY_PAGE = 50
+
+
+def timed(fn, repeat: int):
+    """Runs fn repeat times; returns its last result and the timings."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return result, summarize(times)
+
+
+def summarize(times: list) -> dict:
+    return {
+        "median_seconds": round(statistics.median(times), 4),
+        "min_seconds": round(min(times), 4),
+        "runs": len(times),
+    }
+
+
+def highlights_for(duration: float) -> list:
+    return [
+        {"start": round(duration * start, 3), "end": round(duration * end, 3), "description": f"Highlight {i + 1}"}
+        for i, (start, end) in enumerate(HIGHLIGHT_FRACTIONS)
+    ]
+
+
+def generate_source(source_dir: str, codec: str, width: int, height: int, duration: int) -> str:
+    """testsrc2 video with a sine tone, bit-exact so every run encodes the same file."""
+    path = os.path.join(source_dir, f"{codec}_{width}x{height}_{duration}s.mp4")
+    if os.path.exists(path):
+        return path
+    video = ffmpeg.input(f"testsrc2=size={width}x{height}:rate={SOURCE_FPS}:duration={duration}", f="lavfi")
+    audio = ffmpeg.input(f"sine=frequency=440:sample_rate=48000:duration={duration}", f="lavfi")
+    tmp_path = f"{path}.tmp.mp4"
+    (
+        ffmpeg
+        .output(video, audio, tmp_path, vcodec=ENCODERS[codec], pix_fmt="yuv420p", g=SOURCE_FPS * 2,
+                acodec="aac", audio_bitrate="128k", map_metadata=-1, fflags="+bitexact")
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+class FakeGemini:
+    """
+    Stands in for the genai module (see AIEngine's client argument):
+    uploads are instantly active and every prompt is answered with
+    HIGHLIGHT_FRACTIONS of the uploaded file after `latency` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._durations = {}
+
+    def upload_file(self, path: str):
+        name = f"files/{uuid.uuid4().hex}"
+        self._durations[name] = float(ffmpeg.probe(path)["format"]["duration"])
+        return SimpleNamespace(name=name, uri=f"fake://{name}", state=SimpleNamespace(name="ACTIVE"))
+
+    def get_file(self, name: str):
+        return SimpleNamespace(name=name, uri=f"fake://{name}", state=SimpleNamespace(name="ACTIVE"))
+
+    def GenerativeModel(self, model_name: str):
+        return SimpleNamespace(generate_content=self.generate_content)
+
+    def generate_content(self, parts: list):
+        video_file = parts[0]
+        time.sleep(self.latency)
+        duration = self._durations[video_file.name]
+
+        def mmss(seconds: float) -> str:
+            seconds = int(seconds)
+            return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+        return SimpleNamespace(text=json.dumps([
+            {"start": mmss(h["start"]), "end": mmss(h["end"]), "description": h["description"], "score": 5}
+            for h in highlights_for(duration)
+        ]))
+
+
+def bench_metadata(sources: dict, args) -> dict:
+    from metadata_extractor import MetadataExtractor
+
+    extractor = MetadataExtractor()
+    return {name: timed(lambda: extractor.extract_metadata(path), args.repeat)[1]
+            for name, path in sources.items()}
+
+
+def bench_cut(sources: dict, args, work_dir: str) -> dict:
+    from video_processor import VideoProcessor
+
+    processor = VideoProcessor()
+    results = {}
+    for name, path in sources.items():
+        duration = float(ffmpeg.probe(path)["format"]["duration"])
+        start, end = duration * 0.4, duration * 0.6
+        output = os.path.join(work_dir, "cut.mp4")
+        results[name] = {
+            "reencode": timed(lambda: processor.cut_video(path, start, end, output), args.repeat)[1],
+            "smart": timed(lambda: processor.smart_cut_video(path, start, end, output), args.repeat)[1],
+        }
+    return results
+
+
+def bench_concat(sources: dict, args, work_dir: str) -> dict:
+    from video_processor import VideoProcessor
+
+    processor = VideoProcessor()
+    results = {}
+    for name, path in sources.items():
+        duration = float(ffmpeg.probe(path)["format"]["duration"])
+        clip_dir = tempfile.mkdtemp(dir=work_dir)
+        clips = processor.cut_segments(path, highlights_for(duration), clip_dir)
+        output = os.path.join(work_dir, "concat.mp4")
+        results[name] = timed(lambda: processor.concatenate_videos(clips, output), args.repeat)[1]
+        shutil.rmtree(clip_dir, ignore_errors=True)
+    return results
+
+
+def bench_highlights(sources: dict, args, work_dir: str) -> dict:
+    from video_processor import VideoProcessor
+    from segment_cache import SegmentCache
+
+    modes = {
+        "segments": VideoProcessor(pipeline_mode="segments"),
+        "filtergraph": VideoProcessor(pipeline_mode="filtergraph"),
+        "stream_copy": VideoProcessor(append_strategy="stream_copy"),
+        "segments_cached": VideoProcessor(
+            pipeline_mode="segments",
+            segment_cache=SegmentCache(os.path.join(work_dir, "segments")),
+        ),
+    }
+    results = {}
+    for name, path in sources.items():
+        duration = float(ffmpeg.probe(path)["format"]["duration"])
+        highlights = highlights_for(duration)
+        output = os.path.join(work_dir, "highlights.mp4")
+        content_hash = f"bench-{name}"
+        results[name] = {}
+        for mode, processor in modes.items():
+            if processor.segment_cache is not None:
+                # Warm the cache so the timed runs only concatenate
+                processor.process_highlights(path, highlights, output, content_hash=content_hash)
+            ok, timing = timed(
+                lambda: processor.process_highlights(path, highlights, output, content_hash=content_hash),
+                args.repeat,
+            )
+            results[name][mode] = {**timing, "ok": bool(ok)}
+    return results
+
+
+async def bench_pipeline(sources: dict, args, work_dir: str) -> dict:
+    import main
+    from ai_engine import AIEngine
+    from analysis_cache import AnalysisCache
+
+    results = {}
+    original_engine = main.ai_engine
+    try:
+        for name, path in sources.items():
+            runs = []
+            stages = {}
+            status = None
+            for _ in range(args.repeat):
+                # Fresh upload and analysis cache so every run misses the proxy and analysis caches
+                file_id = str(uuid.uuid4())
+                file_path = f"uploads/{file_id}_{os.path.basename(path)}"
+                shutil.copyfile(path, file_path)
+                main.file_registry.add_upload(file_id, file_path)
+                main.ai_engine = AIEngine(client=FakeGemini(args.gemini_latency),
+                                          cache=AnalysisCache(tempfile.mkdtemp(dir=work_dir)))
+                await asyncio.to_thread(main.on_upload_complete, file_id, file_path)
+
+                job_id = str(uuid.uuid4())
+                main.job_store.create({"id": job_id, "file_id": file_id, "type": "agentic", "status": "queued",
+                                       "timeline": []})
+                started = time.perf_counter()
+                await main.process_video_task(job_id, file_path)
+                runs.append(time.perf_counter() - started)
+
+                job = main.job_store.get(job_id)
+                status = job["status"]
+                for entry in job.get("timeline", []):
+                    if "duration_seconds" in entry:
+                        stages.setdefault(entry.get("stage") or entry["event"], []).append(entry["duration_seconds"])
+            results[name] = {
+                **summarize(runs),
+                "status": status,
+                "stage_median_seconds": {stage: round(statistics.median(times), 4)
+                                         for stage, times in stages.items()},
+            }
+    finally:
+        main.ai_engine = original_engine
+    return results
+
+
+async def bench_library(args, work_dir: str) -> dict:
+    import main
+    from metadata_store import MetadataStore
+
+    placeholder_dir = os.path.join(work_dir, "library")
+    os.makedirs(placeholder_dir, exist_ok=True)
+    results = {}
+    original_store = main.metadata_store
+    try:
+        for size in LIBRARY_SIZES:
+            store = MetadataStore(os.path.join(work_dir, f"library_{size}.db"))
+            for i in range(size):
+                file_id = f"{i:08d}"
+                path = os.path.join(placeholder_dir, f"{file_id}.mp4")
+                if not os.path.exists(path):
+                    open(path, "wb").close()
+                duration = 30 + i % 600
+                store.put(file_id, path, {
+                    "file_id": file_id,
+                    "path": path,
+                    "filename": f"video_{i}.mp4",
+                    "file_size": 0,
+                    "file_size_mb": 0,
+                    "duration": duration,
+                    "duration_formatted": f"{duration // 60:02d}:{duration % 60:02d}",
+                    "upload_time": f"2024-01-01T00:{(i // 60) % 60:02d}:{i % 60:02d}",
+                    "format": "mov,mp4,m4a,3gp,3g2,mj2",
+                    "width": 1920,
+                    "height": 1080,
+                    "codec": "h264",
+                })
+            main.metadata_store = store
+
+            results[str(size)] = {}
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+                for case, params in (("all", {}), ("page", {"limit": LIBRARY_PAGE}),
+                                     ("page_by_duration", {"limit": LIBRARY_PAGE, "sort": "duration"})):
+                    times = []
+                    response = None
+                    for _ in range(args.repeat):
+                        started = time.perf_counter()
+                        response = await http.get("/videos", params=params)
+                        times.append(time.perf_counter() - started)
+                    results[str(size)][case] = {**summarize(times), "bytes": len(response.content),
+                                                "status": response.status_code}
+    finally:
+        main.metadata_store = original_store
+    return results
+
+
+def bench_fanout(args) -> dict:
+    import ws_fanout
+    from connection_manager import ConnectionManager
+
+    fanout_args = argparse.Namespace(viewers=500, slow=25, slow_ms=200, stalled=5, messages=2000,
+                                     interval_ms=0.5, progress_every=20, timeout=30, seed=0)
+    return asyncio.run(ws_fanout.run(ConnectionManager(send_timeout=2), fanout_args, 0.001))
+
+
+def environment() -> dict:
+    def output(*command):
+        try:
+            return subprocess.run(command, capture_output=True, text=True, cwd=BACKEND_DIR).stdout.strip()
+        except OSError:
+            return None
+
+    ffmpeg_version = output("ffmpeg", "-version")
+    return {
+        "commit": output("git", "rev-parse", "--short", "HEAD"),
+        "dirty": bool(output("git", "status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version.splitlines()[0] if ffmpeg_version else None,
+    }
+
+
+def timings(results: dict, prefix: str = ""):
+    """Yields (dotted path, seconds) for every median timing in results."""
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from timings(value, f"{prefix}{key}.")
+        elif key == "median_seconds":
+            yield prefix.rstrip("."), value
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    before = dict(timings(baseline.get("results", {})))
+    comparison = {}
+    for path, seconds in timings(results):
+        if before.get(path):
+            comparison[path] = {
+                "before": before[path],
+                "after": seconds,
+                "change_percent": round((seconds - before[path]) / before[path] * 100, 1),
+            }
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", default=",".join(SECTIONS), help=f"comma-separated, from {', '.join(SECTIONS)}")
+    parser.add_argument("--durations", default="10,60", help="source durations in seconds")
+    parser.add_argument("--resolutions", default="640x360,1920x1080")
+    parser.add_argument("--codecs", default="h264,hevc", help=f"source codecs, from {', '.join(ENCODERS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="seconds the fake Gemini takes to answer")
+    parser.add_argument("--workdir", default=None, help="kept between runs to reuse generated sources")
+    parser.add_argument("--baseline", default=None, help="earlier JSON output to compare against")
+    parser.add_argument("--output", default=None, help="also write the JSON to this file")
+    args = parser.parse_args()
+
+    sections = [section for section in args.sections.split(",") if section]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    have_ffmpeg = shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+    skipped = [section for section in sections if section in FFMPEG_SECTIONS and not have_ffmpeg]
+    sections = [section for section in sections if section not in skipped]
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    # main.py creates uploads/, processed/ and data/ in the working directory,
+    # so the whole run happens in a scratch one with an in-memory job store
+    work_dir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="bench_suite_")
+    keep_work_dir = args.workdir is not None
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    os.environ["JOB_STORE"] = "memory"
+    os.environ["EXECUTION_MODE"] = "inline"
+    # The pipeline section measures a first render, not a cache hit
+    os.environ.setdefault("SEGMENT_CACHE", "false")
+
+    results = {}
+    sources = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if FFMPEG_SECTIONS & set(sections):
+                source_dir = os.path.join(work_dir, "sources")
+                os.makedirs(source_dir, exist_ok=True)
+                for codec in args.codecs.split(","):
+                    for resolution in args.resolutions.split(","):
+                        width, height = (int(n) for n in resolution.split("x"))
+                        for duration in args.durations.split(","):
+                            name = f"{codec}_{width}x{height}_{duration}s"
+                            sources[name] = generate_source(source_dir, codec, width, height, int(duration))
+
+            scratch = os.path.join(work_dir, "scratch")
+            os.makedirs(scratch, exist_ok=True)
+            for section in sections:
+                if section == "metadata":
+                    results[section] = bench_metadata(sources, args)
+                elif section == "cut":
+                    results[section] = bench_cut(sources, args, scratch)
+                elif section == "concat":
+                    results[section] = bench_concat(sources, args, scratch)
+                elif section == "highlights":
+                    results[section] = bench_highlights(sources, args, scratch)
+                elif section == "pipeline":
+                    results[section] = asyncio.run(bench_pipeline(sources, args, scratch))
+                elif section == "library":
+                    results[section] = asyncio.run(bench_library(args, scratch))
+                elif section == "fanout":
+                    results[section] = bench_fanout(args)
+    finally:
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "environment": environment(),
+        "config": {
+            "durations": args.durations,
+            "resolutions": args.resolutions,
+            "codecs": args.codecs,
+            "repeat": args.repeat,
+            "gemini_latency": args.gemini_latency,
+        },
+        "skipped_sections": skipped,
+        "results": results,
+    }
+    if baseline_path:
+        with open(baseline_path) as f:
+            report["comparison"] = compare(results, json.load(f))
+    text = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
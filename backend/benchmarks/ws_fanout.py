@@ -0,0 +1,192 @@
+"""
+WebSocket log fan-out under load: hundreds of simulated viewers of one
+job, a share of them slow or stalled, fed a burst of log lines and
+progress updates.
+
+    cd backend
+    python benchmarks/ws_fanout.py --viewers 500 --slow 25 --stalled 5 --messages 2000
+
+The viewers are in-process stand-ins for sockets whose send_json takes
+a configurable time (stalled ones never return), so runs are repeatable
+and no network is involved. The same load goes through ConnectionManager
+and through the old sequential broadcast loop; for each, the JSON output
+shows how long the job was blocked in broadcast() and the latency from
+broadcast to delivery seen by healthy viewers.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from connection_manager import ConnectionManager
+
+
+class SimulatedViewer:
+    """Stands in for a WebSocket: send_json takes `latency` seconds, forever if None."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.frames = 0
+        self.messages = 0
+        self.delivery = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, frame: dict):
+        if self.latency is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.latency)
+        now = time.perf_counter()
+        messages = frame["messages"] if frame.get("type") == "bundle" else [frame]
+        self.frames += 1
+        self.messages += len(messages)
+        self.delivery.extend(now - message["sent"] for message in messages if "sent" in message)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+class SequentialManager:
+    """The fan-out ConnectionManager replaced: awaits each socket in turn."""
+
+    def __init__(self):
+        self.active_connections = {}
+
+    async def connect(self, job_id, websocket):
+        await websocket.accept()
+        self.active_connections.setdefault(job_id, []).append(websocket)
+
+    def disconnect(self, job_id, websocket):
+        if websocket in self.active_connections.get(job_id, []):
+            self.active_connections[job_id].remove(websocket)
+
+    async def broadcast(self, job_id, message):
+        for connection in self.active_connections.get(job_id, [])[:]:
+            try:
+                await connection.send_json(message)
+            except Exception:
+                self.disconnect(job_id, connection)
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(manager, args, healthy_latency: float) -> dict:
+    rng = random.Random(args.seed)
+    viewers = (
+        [SimulatedViewer(healthy_latency * rng.uniform(0.5, 1.5)) for _ in range(args.viewers - args.slow - args.stalled)]
+        + [SimulatedViewer(args.slow_ms / 1000) for _ in range(args.slow)]
+        + [SimulatedViewer(None) for _ in range(args.stalled)]
+    )
+    healthy = viewers[:args.viewers - args.slow - args.stalled]
+    for viewer in viewers:
+        await manager.connect("job", viewer)
+
+    blocked = []
+    started = time.perf_counter()
+    deadline = started + args.timeout
+    for i in range(args.messages):
+        if i % args.progress_every == 0:
+            message = {"type": "progress", "percent": 100 * i / args.messages}
+        else:
+            message = {"type": "log", "level": "info", "message": f"line {i}"}
+        message["sent"] = time.perf_counter()
+        before = time.perf_counter()
+        try:
+            await asyncio.wait_for(manager.broadcast("job", message), max(0.0, deadline - before))
+        except asyncio.TimeoutError:
+            blocked.append(time.perf_counter() - before)
+            break
+        blocked.append(time.perf_counter() - before)
+        if args.interval_ms:
+            await asyncio.sleep(args.interval_ms / 1000)
+    produced = len(blocked)
+
+    # Wait for healthy viewers to drain what they are going to receive
+    while time.perf_counter() < deadline:
+        received = sum(viewer.messages for viewer in healthy)
+        await asyncio.sleep(0.2)
+        if sum(viewer.messages for viewer in healthy) == received:
+            break
+
+    if isinstance(manager, ConnectionManager):
+        # Give stalled viewers time to hit the send timeout and be dropped
+        await asyncio.sleep(max(0.0, min(deadline, time.perf_counter() + manager.send_timeout) - time.perf_counter()))
+
+    delivery = [latency for viewer in healthy for latency in viewer.delivery]
+    frames = sum(viewer.frames for viewer in healthy)
+    messages = sum(viewer.messages for viewer in healthy)
+    result = {
+        "messages_produced": produced,
+        "producer_seconds": round(sum(blocked), 3),
+        "broadcast_ms": {
+            "p50": round(percentile(blocked, 50) * 1000, 3),
+            "p99": round(percentile(blocked, 99) * 1000, 3),
+            "max": round(max(blocked) * 1000, 3),
+        },
+        "healthy_delivery_ms": {
+            "p50": round(percentile(delivery, 50) * 1000, 2),
+            "p99": round(percentile(delivery, 99) * 1000, 2),
+        },
+        "healthy_messages_per_viewer": round(messages / max(1, len(healthy)), 1),
+        "healthy_messages_per_frame": round(messages / max(1, frames), 2),
+        "slow_messages_per_viewer": round(
+            sum(viewer.messages for viewer in viewers[len(healthy):len(healthy) + args.slow]) / max(1, args.slow), 1
+        ),
+        "closed_viewers": sum(viewer.closed for viewer in viewers),
+    }
+    if isinstance(manager, ConnectionManager):
+        result["dropped_clients"] = manager.dropped_clients
+        for viewer in viewers:
+            manager.disconnect("job", viewer)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, default=500)
+    parser.add_argument("--slow", type=int, default=25, help="viewers whose every send takes --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=200)
+    parser.add_argument("--stalled", type=int, default=5, help="viewers whose send never completes")
+    parser.add_argument("--healthy-ms", type=float, default=1, help="mean send time of the other viewers")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--interval-ms", type=float, default=0.5, help="pause between produced messages")
+    parser.add_argument("--progress-every", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30, help="cap on each run, the sequential one never finishes with stalled viewers")
+    parser.add_argument("--send-timeout", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # ConnectionManager prints every connect and disconnect
+    with contextlib.redirect_stdout(io.StringIO()):
+        managers = {
+            "connection_manager": asyncio.run(
+                run(ConnectionManager(send_timeout=args.send_timeout), args, args.healthy_ms / 1000)
+            ),
+            "sequential": asyncio.run(run(SequentialManager(), args, args.healthy_ms / 1000)),
+        }
+    results = {
+        "viewers": args.viewers,
+        "slow": args.slow,
+        "stalled": args.stalled,
+        "messages": args.messages,
+        "managers": managers,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 50 * 1024 * 1024 * 1024))
+# Sessions are preallocated at full size, so both their number and the
+# disk space they reserve are capped, and idle ones are swept
+MAX_UPLOAD_SESSIONS = int(os.getenv("MAX_UPLOAD_SESSIONS", 16))
+MAX_RESERVED_UPLOAD_BYTES = int(os.getenv("MAX_RESERVED_UPLOAD_BYTES", 100 * 1024 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
+
+
+class UploadError(Exception):
+    """Raised for invalid upload requests; status_code maps to the HTTP response."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadSession:
+    """
+    One resumable upload. Bytes are written in place into a preallocated
+    hidden file next to the final path and hashed as they arrive, so
+    finalizing is a rename with no second copy.
+    """
+
+    def __init__(self, upload_id: str, file_id: str, filename: str, size: int,
+                 upload_dir: str, received: int = 0, created_at: str = None, updated_at: str = None):
+        self.upload_id = upload_id
+        self.file_id = file_id
+        self.filename = filename
+        self.size = size
+        self.received = received
+        self.created_at = created_at or datetime.now().isoformat()
+        # Last chunk received; idle sessions expire after UPLOAD_SESSION_TTL_HOURS
+        self.updated_at = updated_at or self.created_at
+        self.closed = False
+        self.final_path = f"{upload_dir}/{file_id}_{filename}"
+        self.part_path = f"{upload_dir}/.{file_id}_{filename}.part"
+        self.meta_path = f"{upload_dir}/.{upload_id}.upload.json"
+        self.lock = threading.Lock()
+        self._hash = None
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.received,
+            "chunk_size": UPLOAD_CHUNK_SIZE,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def save(self):
+        with open(self.meta_path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    def preallocate(self):
+        with open(self.part_path, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(f.fileno(), 0, self.size)
+            else:
+                f.truncate(self.size)
+
+    def _digest(self):
+        # After a restart, rebuild the running hash from the bytes on disk
+        if self._hash is None:
+            self._hash = hashlib.sha256()
+            remaining = self.received
+            with open(self.part_path, "rb") as f:
+                while remaining > 0:
+                    data = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    self._hash.update(data)
+                    remaining -= len(data)
+        return self._hash
+
+    def write(self, offset: int, data: bytes) -> int:
+        """Writes data at offset, which must be the next expected byte."""
+        with self.lock:
+            if self.closed:
+                raise UploadError("Upload was aborted or has expired", 404)
+            if offset != self.received:
+                raise UploadError(f"Expected offset {self.received}, got {offset}", 409)
+            if self.received + len(data) > self.size:
+                raise UploadError("Chunk extends past the declared upload size", 413)
+            digest = self._digest()
+            with open(self.part_path, "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+            digest.update(data)
+            self.received += len(data)
+            self.updated_at = datetime.now().isoformat()
+            self.save()
+            return self.received
+
+    def finalize(self, expected_sha256: str = None) -> str:
+        with self.lock:
+            if self.closed:
+                raise UploadError("Upload was aborted or has expired", 404)
+            if self.received != self.size:
+                raise UploadError(f"Upload incomplete: {self.received} of {self.size} bytes received", 409)
+            content_hash = self._digest().hexdigest()
+            if expected_sha256 and expected_sha256.lower() != content_hash:
+                raise UploadError("Checksum mismatch", 422)
+            os.replace(self.part_path, self.final_path)
+            os.remove(self.meta_path)
+            self.closed = True
+            return content_hash
+
+    def abort(self):
+        with self.lock:
+            self.closed = True
+            for path in (self.part_path, self.meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class ChunkedUploadManager:
+    """
+    Tracks resumable upload sessions; sessions survive restarts via
+    sidecar files. At most max_sessions may be open, reserving at most
+    max_reserved_bytes between them; cleanup_expired() removes sessions
+    idle for longer than the TTL, along with their preallocated files.
+    """
+
+    def __init__(self, upload_dir: str = "uploads", max_sessions: int = MAX_UPLOAD_SESSIONS,
+                 max_reserved_bytes: int = MAX_RESERVED_UPLOAD_BYTES):
+        self.upload_dir = upload_dir
+        self.max_sessions = max_sessions
+        self.max_reserved_bytes = max_reserved_bytes
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+        self._load_sessions()
+
+    def _load_sessions(self):
+        for name in os.listdir(self.upload_dir):
+            if not name.endswith(".upload.json"):
+                continue
+            try:
+                with open(f"{self.upload_dir}/{name}") as f:
+                    data = json.load(f)
+                session = UploadSession(
+                    data["upload_id"], data["file_id"], data["filename"], data["size"],
+                    self.upload_dir, received=data["offset"], created_at=data.get("created_at"),
+                    updated_at=data.get("updated_at"),
+                )
+                if os.path.exists(session.part_path):
+                    self._sessions[session.upload_id] = session
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping unreadable upload session {name}: {e}")
+
+    def create(self, filename: str, size: int) -> UploadSession:
+        filename = os.path.basename(filename)
+        if not filename:
+            raise UploadError("Filename is required")
+        if size <= 0 or size > MAX_UPLOAD_SIZE:
+            raise UploadError(f"Upload size must be between 1 and {MAX_UPLOAD_SIZE} bytes", 413)
+        session = UploadSession(str(uuid.uuid4()), str(uuid.uuid4()), filename, size, self.upload_dir)
+        # Reserve the slot before allocating, so concurrent creates can't overshoot the caps
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise UploadError(f"Too many uploads in progress (limit {self.max_sessions})", 429)
+            if self.reserved_bytes() + size > self.max_reserved_bytes:
+                raise UploadError("Not enough upload space reserved for this file, try again later", 507)
+            self._sessions[session.upload_id] = session
+        try:
+            session.preallocate()
+            session.save()
+        except BaseException:
+            self.finish(session.upload_id)
+            session.abort()
+            raise
+        return session
+
+    def reserved_bytes(self) -> int:
+        """Disk space preallocated by open sessions. Caller holds _lock."""
+        return sum(session.size for session in self._sessions.values())
+
+    def cleanup_expired(self, ttl_hours: float = UPLOAD_SESSION_TTL_HOURS) -> int:
+        """Abort sessions that received nothing for ttl_hours and delete their files."""
+        cutoff = (datetime.now() - timedelta(hours=ttl_hours)).isoformat()
+        with self._lock:
+            expired = [session for session in self._sessions.values() if session.updated_at < cutoff]
+            for session in expired:
+                del self._sessions[session.upload_id]
+        for session in expired:
+            print(f"Removing idle upload {session.upload_id} ({session.received} of {session.size} bytes)")
+            session.abort()
+        return len(expired)
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        with self._lock:
+            return self._sessions.get(upload_id)
+
+    def finish(self, upload_id: str):
+        with self._lock:
+            self._sessions.pop(upload_id, None)
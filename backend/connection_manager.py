@@ -0,0 +1,192 @@
+import os
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+# Messages waiting for one client before its log lines start being dropped
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", 256))
+# Messages arriving within this window go out together as one bundle frame
+WS_BATCH_WINDOW = float(os.getenv("WS_BATCH_WINDOW", 0.05))
+WS_MAX_BATCH = int(os.getenv("WS_MAX_BATCH", 100))
+# A client whose send takes longer than this, or that has had this many
+# log lines dropped without catching up, is disconnected
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 10))
+WS_MAX_DROPPED = int(os.getenv("WS_MAX_DROPPED", 1000))
+
+# Under pressure these are dropped oldest-first; everything else is kept
+# or the client is disconnected so it can reconnect and resync
+DROPPABLE_TYPES = ("log",)
+
+
+def _latest_only_key(message: dict):
+    """
+    Messages that supersede earlier ones with the same key, so a client
+    that is behind only needs the newest.
+    """
+    kind = message.get("type")
+    if kind == "progress":
+        return kind, message.get("job_id")
+    if kind == "batch_progress":
+        # The summary covers the whole batch, whichever child triggered it
+        return kind
+    return None
+
+
+class _Connection:
+    """One client's outbound queue, drained by its own sender task."""
+
+    def __init__(self, websocket: WebSocket, max_pending: int):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.pending: deque = deque()
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.dropped_total = 0
+        self.sender: asyncio.Task = None
+
+    def offer(self, message: dict) -> bool:
+        """Queues message; returns False when the client is too far behind to keep."""
+        key = _latest_only_key(message)
+        if key is not None:
+            for i, queued in enumerate(self.pending):
+                if _latest_only_key(queued) == key:
+                    self.pending[i] = message
+                    return True
+
+        if len(self.pending) >= self.max_pending:
+            for i, queued in enumerate(self.pending):
+                if queued.get("type") in DROPPABLE_TYPES:
+                    del self.pending[i]
+                    self.dropped += 1
+                    self.dropped_total += 1
+                    break
+            else:
+                return False
+            if self.dropped_total > WS_MAX_DROPPED:
+                return False
+
+        self.pending.append(message)
+        self.wakeup.set()
+        return True
+
+    def next_frame(self, max_batch: int) -> Optional[dict]:
+        batch = [self.pending.popleft() for _ in range(min(len(self.pending), max_batch))]
+        if self.dropped:
+            batch.append({
+                "type": "log",
+                "level": "warning",
+                "message": f"{self.dropped} log messages skipped (connection too slow)",
+                "timestamp": datetime.now().isoformat(),
+            })
+            self.dropped = 0
+        if self.pending:
+            self.wakeup.set()
+        else:
+            self.dropped_total = 0
+        if not batch:
+            return None
+        return batch[0] if len(batch) == 1 else {"type": "bundle", "messages": batch}
+
+
+class ConnectionManager:
+    """
+    WebSocket fan-out per job.
+
+    broadcast() never waits on a socket: each connection has a bounded
+    queue and a sender task, so one slow viewer can't delay the others or
+    the job that logged the message. Messages that arrive close together
+    are sent as one {"type": "bundle", "messages": [...]} frame. A client
+    that falls behind first has progress updates collapsed to the newest
+    and old log lines dropped; if it still can't keep up it is
+    disconnected and can reconnect to resync.
+    """
+
+    def __init__(self, max_pending: int = WS_QUEUE_SIZE, batch_window: float = WS_BATCH_WINDOW,
+                 max_batch: int = WS_MAX_BATCH, send_timeout: float = WS_SEND_TIMEOUT):
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.send_timeout = send_timeout
+        # Map job_id to active connections
+        self.active_connections: Dict[str, Dict[WebSocket, _Connection]] = {}
+        self.dropped_clients = 0
+
+    async def connect(self, job_id: str, websocket: WebSocket):
+        await websocket.accept()
+        self.register(job_id, websocket)
+        print(f"Client connected to job {job_id}. Total clients: {len(self.active_connections[job_id])}")
+
+    def register(self, job_id: str, websocket: WebSocket):
+        """Starts fan-out to an already accepted websocket."""
+        connection = _Connection(websocket, self.max_pending)
+        self.active_connections.setdefault(job_id, {})[websocket] = connection
+        connection.sender = asyncio.create_task(self._send_loop(job_id, connection))
+
+    def disconnect(self, job_id: str, websocket: WebSocket):
+        connections = self.active_connections.get(job_id)
+        if connections is None:
+            return
+        connection = connections.pop(websocket, None)
+        if not connections:
+            del self.active_connections[job_id]
+        if connection is not None:
+            if connection.sender is not asyncio.current_task():
+                connection.sender.cancel()
+            print(f"Client disconnected from job {job_id}")
+
+    def send(self, job_id: str, websocket: WebSocket, message: dict):
+        """Queues a message for one client (e.g. the initial timeline)."""
+        connection = self.active_connections.get(job_id, {}).get(websocket)
+        if connection is not None and not connection.offer(message):
+            self._drop(job_id, connection)
+
+    async def broadcast(self, job_id: str, message: dict):
+        for connection in list(self.active_connections.get(job_id, {}).values()):
+            if not connection.offer(message):
+                self._drop(job_id, connection)
+
+    def _drop(self, job_id: str, connection: _Connection):
+        print(f"Dropping slow client from job {job_id}")
+        self.dropped_clients += 1
+        self.disconnect(job_id, connection.websocket)
+        asyncio.create_task(self._close(connection.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            # 1013: try again later
+            await asyncio.wait_for(websocket.close(code=1013), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _send_loop(self, job_id: str, connection: _Connection):
+        try:
+            while True:
+                await connection.wakeup.wait()
+                # Let a burst accumulate so it goes out as one frame
+                await asyncio.sleep(self.batch_window)
+                connection.wakeup.clear()
+                frame = connection.next_frame(self.max_batch)
+                if frame is None:
+                    continue
+                await asyncio.wait_for(connection.websocket.send_json(frame), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._drop(job_id, connection)
+        except Exception as e:
+            print(f"Error sending to client: {e}")
+            self.disconnect(job_id, connection.websocket)
+
+    def stats(self) -> dict:
+        connections: List[_Connection] = [
+            connection for job in self.active_connections.values() for connection in job.values()
+        ]
+        return {
+            "jobs": len(self.active_connections),
+            "clients": len(connections),
+            "queued_messages": sum(len(connection.pending) for connection in connections),
+            "dropped_clients": self.dropped_clients,
+        }
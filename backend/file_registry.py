@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+# A lookup miss rescans the upload directory at most this often, so
+# uploads written by another worker process are still found
+REGISTRY_RESCAN_INTERVAL = float(os.getenv("REGISTRY_RESCAN_INTERVAL", 5))
+
+
+class FileRegistry:
+    """
+    Index from file_id to its upload path and to the artifacts derived
+    from it (processed outputs, HLS packages, proxies, previews).
+
+    Uploads are named {file_id}_{original_name}; the upload directory is
+    scanned once at startup and kept current as files are uploaded and
+    deleted, so lookups never list the directory. Every artifact belongs
+    to exactly one upload (previews are keyed by file_id and mtime), and a
+    reverse index lets one be forgotten by path alone.
+    """
+
+    def __init__(self, upload_dir: str = "uploads"):
+        self.upload_dir = upload_dir
+        self._uploads: Dict[str, str] = {}
+        self._artifacts: Dict[str, Set[str]] = {}
+        # artifact path -> the file_id it was derived from
+        self._owner: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._last_scan = 0.0
+        self.scan_uploads()
+
+    def scan_uploads(self) -> int:
+        """Adds every upload on disk to the index; returns how many were found."""
+        found = {}
+        for filename in os.listdir(self.upload_dir):
+            if filename.startswith('.') or '_' not in filename:
+                continue
+            found[filename.split('_', 1)[0]] = f"{self.upload_dir}/{filename}"
+        with self._lock:
+            self._uploads.update(found)
+            self._last_scan = time.monotonic()
+        return len(found)
+
+    def add_upload(self, file_id: str, path: str):
+        with self._lock:
+            self._uploads[file_id] = path
+
+    def upload_path(self, file_id: str) -> Optional[str]:
+        with self._lock:
+            path = self._uploads.get(file_id)
+            rescan = path is None and time.monotonic() - self._last_scan >= REGISTRY_RESCAN_INTERVAL
+        if rescan:
+            self.scan_uploads()
+            with self._lock:
+                path = self._uploads.get(file_id)
+        return path
+
+    def uploads(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._uploads)
+
+    def add_artifact(self, file_id: str, path: str):
+        with self._lock:
+            self._artifacts.setdefault(file_id, set()).add(path)
+            self._owner[path] = file_id
+
+    def artifacts(self, file_id: str) -> List[str]:
+        with self._lock:
+            return sorted(self._artifacts.get(file_id, ()))
+
+    def remove_artifact(self, path: str):
+        """Forgets an artifact that was deleted on its own."""
+        with self._lock:
+            file_id = self._owner.pop(path, None)
+            paths = self._artifacts.get(file_id)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self._artifacts[file_id]
+
+    def remove(self, file_id: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Drops file_id from the index. Returns its upload path and its
+        artifacts, for the caller to delete.
+        """
+        with self._lock:
+            upload_path = self._uploads.pop(file_id, None)
+            artifacts = self._artifacts.pop(file_id, set())
+            for path in artifacts:
+                self._owner.pop(path, None)
+        return upload_path, sorted(artifacts)
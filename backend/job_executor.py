@@ -0,0 +1,282 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, CancelledError
+from typing import Callable, Dict, Iterable, Optional
+
+MAX_PARALLEL_JOBS = int(os.getenv("MAX_PARALLEL_JOBS", max(1, (os.cpu_count() or 2) // 2)))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 32))
+# Seconds of estimated cost a waiting job is forgiven per second it waits,
+# so cheap jobs go first but an expensive one is never starved
+SCHEDULER_AGING_RATE = float(os.getenv("SCHEDULER_AGING_RATE", 2))
+# Window over which wait times and utilisation are reported
+SCHEDULER_STATS_WINDOW = float(os.getenv("SCHEDULER_STATS_WINDOW", 300))
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+
+class JobCancelledError(Exception):
+    """Raised when a job is cancelled before or while it runs."""
+
+
+class _QueuedJob:
+    def __init__(self, job_id: str, group: str, fn: Callable, args: tuple, kwargs: dict, cost: float = 0.0):
+        self.job_id = job_id
+        self.group = group
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cost = cost or 0.0
+        self.submitted = time.monotonic()
+        # When the job reached the head of its group; its aging clock starts here
+        self.eligible = self.submitted
+        self.future = Future()
+
+
+def pick_group(heads: Iterable[tuple], aging_rate: float, now: float):
+    """
+    The group whose head job should run next: lowest estimated cost after
+    subtracting aging_rate seconds per second the head has waited. heads
+    yields (group, cost, eligible_since) in round-robin order, which
+    breaks ties.
+    """
+    best, best_score = None, None
+    for group, cost, eligible in heads:
+        score = cost - aging_rate * (now - eligible)
+        if best_score is None or score < best_score:
+            best, best_score = group, score
+    return best
+
+
+class LaneStats:
+    """
+    Wait times and utilisation of one scheduling lane over the last
+    window seconds. Not thread-safe; callers hold their own lock.
+    """
+
+    def __init__(self, capacity: int, window: float = SCHEDULER_STATS_WINDOW):
+        self.capacity = capacity
+        self.window = window
+        self._started = time.monotonic()
+        self._waits: deque = deque()  # (dispatched_at, waited)
+        self._busy: deque = deque()   # (started_at, finished_at)
+        self._running: Dict[str, float] = {}
+        self.completed = 0
+
+    def _trim(self, now: float):
+        while self._waits and self._waits[0][0] < now - self.window:
+            self._waits.popleft()
+        while self._busy and self._busy[0][1] < now - self.window:
+            self._busy.popleft()
+
+    def started(self, key: str, submitted: float):
+        now = time.monotonic()
+        self._waits.append((now, now - submitted))
+        self._running[key] = now
+        self._trim(now)
+
+    def finished(self, key: str):
+        started = self._running.pop(key, None)
+        if started is not None:
+            self._busy.append((started, time.monotonic()))
+            self.completed += 1
+
+    def snapshot(self, queued_since: Iterable[float] = ()) -> dict:
+        now = time.monotonic()
+        self._trim(now)
+        since = max(self._started, now - self.window)
+        busy = sum(end - max(start, since) for start, end in self._busy)
+        busy += sum(now - max(start, since) for start in self._running.values())
+        span = (now - since) * self.capacity
+        waits = sorted(waited for _, waited in self._waits)
+        oldest = max((now - submitted for submitted in queued_since), default=0.0)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(len(waits) * p / 100))], 2) if waits else None
+
+        return {
+            "utilisation": round(busy / span, 3) if span > 0 else 0.0,
+            "completed": self.completed,
+            "wait_seconds": {"p50": pct(50), "p95": pct(95), "max": round(waits[-1], 2) if waits else None},
+            "oldest_queued_seconds": round(oldest, 2),
+        }
+
+
+class JobExecutor:
+    """
+    Runs blocking VideoProcessor work on a bounded pool of worker threads
+    so the event loop stays free for HTTP and WebSocket traffic.
+
+    FFmpeg does the heavy lifting in its own subprocess, so threads are
+    enough to keep several encodes running in parallel. Waiting jobs are
+    queued per group (a batch, or the job itself). Workers take the group
+    head with the lowest estimated cost, less an allowance for how long it
+    has waited (see pick_group), so a short render doesn't sit behind an
+    hour-long re-encode and the long one still runs eventually. A group's
+    aging clock restarts each time it is served, so one large batch can't
+    starve everyone else.
+    """
+
+    def __init__(self, max_workers: int = MAX_PARALLEL_JOBS, max_queue: int = MAX_QUEUED_JOBS,
+                 on_cancel: Optional[Callable[[str], None]] = None, aging_rate: float = SCHEDULER_AGING_RATE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.on_cancel = on_cancel
+        self.aging_rate = aging_rate
+        self._usage = LaneStats(max_workers)
+        self._cond = threading.Condition()
+        # group -> deque of waiting jobs; order is the round-robin order
+        self._groups: "OrderedDict[str, deque]" = OrderedDict()
+        self._pending: Dict[str, _QueuedJob] = {}
+        self._running: set = set()
+        self._shutdown = False
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"ffmpeg-job-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _next_job(self) -> Optional[_QueuedJob]:
+        """Pops the head of the chosen group and rotates that group to the back."""
+        for group in [group for group, queue in self._groups.items() if not queue]:
+            del self._groups[group]
+        if not self._groups:
+            return None
+        now = time.monotonic()
+        group = pick_group(((group, queue[0].cost, queue[0].eligible) for group, queue in self._groups.items()),
+                           self.aging_rate, now)
+        queue = self._groups[group]
+        self._groups.move_to_end(group)
+        job = queue.popleft()
+        if queue:
+            queue[0].eligible = now
+        else:
+            del self._groups[group]
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._shutdown and not self._groups:
+                    self._cond.wait()
+                if self._shutdown:
+                    return
+                job = self._next_job()
+                if job is None:
+                    continue
+                self._pending.pop(job.job_id, None)
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                self._running.add(job.job_id)
+                self._usage.started(job.job_id, job.submitted)
+            try:
+                job.future.set_result(job.fn(*job.args, **job.kwargs))
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running.discard(job.job_id)
+                    self._usage.finished(job.job_id)
+
+    def is_full(self) -> bool:
+        with self._cond:
+            return len(self._pending) >= self.max_queue
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """
+        1-based position in the queue, 0 while running, None if unknown.
+        Positions follow the order workers would dispatch in if nothing
+        else were submitted.
+        """
+        with self._cond:
+            if job_id in self._running:
+                return 0
+            if job_id not in self._pending:
+                return None
+            queues = OrderedDict((group, [[job.job_id, job.cost, job.eligible] for job in queue])
+                                 for group, queue in self._groups.items() if queue)
+        now = time.monotonic()
+        position = 0
+        while queues:
+            group = pick_group(((group, queue[0][1], queue[0][2]) for group, queue in queues.items()),
+                               self.aging_rate, now)
+            queue = queues[group]
+            queues.move_to_end(group)
+            position += 1
+            if queue.pop(0)[0] == job_id:
+                return position
+            if queue:
+                queue[0][2] = now
+            else:
+                del queues[group]
+        return None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "groups": len(self._groups),
+                "queued_cost_seconds": round(sum(job.cost for job in self._pending.values()), 1),
+                **self._usage.snapshot(job.submitted for job in self._pending.values()),
+            }
+
+    def submit(self, job_id: str, fn: Callable, /, *args, group: str = None, cost: float = None, **kwargs) -> Future:
+        """
+        Queue fn(*args, **kwargs) and return a concurrent future. cost is
+        the job's estimated run time in seconds (see scheduler.estimate_cost).
+        job_id and fn are positional-only, so fn can take a job_id keyword.
+        """
+        job = _QueuedJob(job_id, group or job_id, fn, args, kwargs, cost)
+        with self._cond:
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} jobs waiting)")
+            self._pending[job_id] = job
+            self._groups.setdefault(job.group, deque()).append(job)
+            self._cond.notify()
+        return job.future
+
+    async def run(self, job_id: str, fn: Callable, /, *args, group: str = None, cost: float = None, **kwargs):
+        """Submit a job and await its result without blocking the event loop."""
+        future = self.submit(job_id, fn, *args, group=group, cost=cost, **kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except (CancelledError, asyncio.CancelledError):
+            raise JobCancelledError(f"Job {job_id} was cancelled")
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+        Queued jobs are dropped; running jobs have their ffmpeg process killed.
+        """
+        with self._cond:
+            job = self._pending.pop(job_id, None)
+            if job is not None:
+                queue = self._groups.get(job.group)
+                if queue is not None and job in queue:
+                    queue.remove(job)
+                    if not queue:
+                        del self._groups[job.group]
+                job.future.cancel()
+                return True
+            running = job_id in self._running
+
+        if running and self.on_cancel:
+            self.on_cancel(job_id)
+        return running
+
+    def shutdown(self):
+        with self._cond:
+            self._shutdown = True
+            for job in self._pending.values():
+                job.future.cancel()
+            self._pending.clear()
+            self._groups.clear()
+            self._cond.notify_all()
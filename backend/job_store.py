@@ -0,0 +1,375 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+JOB_STORE = os.getenv("JOB_STORE", "sqlite")
+JOBS_DB = os.getenv("JOBS_DB", "data/jobs.db")
+JOB_TTL_HOURS = float(os.getenv("JOB_TTL_HOURS", 24 * 7))
+# A job read from the database (one this process isn't holding) is reused
+# for this long, so a request or log burst doesn't re-read it every time
+JOB_READ_CACHE_SECONDS = float(os.getenv("JOB_READ_CACHE_SECONDS", 1.0))
+
+# Statuses a job can still make progress from
+ACTIVE_STATUSES = ("queued", "analyzing", "processing")
+
+
+class JobRepository:
+    """
+    In-memory job repository. Jobs are plain dicts with at least
+    id, file_id, status and timeline; the API returns them as-is.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+
+    def create(self, job: dict) -> dict:
+        now = datetime.now().isoformat()
+        job.setdefault("created_at", now)
+        job["updated_at"] = now
+        with self._lock:
+            self._jobs[job["id"]] = job
+        self._persist(job["id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def update(self, job_id: str, **fields) -> Optional[dict]:
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job["updated_at"] = datetime.now().isoformat()
+            self._jobs[job_id] = job
+        self._persist(job_id, fields)
+        return job
+
+    def append_timeline(self, job_id: str, entry: dict) -> Optional[list]:
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                return None
+            job.setdefault("timeline", []).append(entry)
+            job["updated_at"] = datetime.now().isoformat()
+            self._jobs[job_id] = job
+        self._persist(job_id, ("timeline",))
+        return job["timeline"]
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def find(self, file_id: str = None, statuses: tuple = None) -> List[dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [
+            job for job in jobs
+            if (file_id is None or job.get("file_id") == file_id)
+            and (statuses is None or job.get("status") in statuses)
+        ]
+
+    def cleanup_expired(self, ttl_hours: float = JOB_TTL_HOURS) -> int:
+        """Delete finished jobs that haven't been touched for ttl_hours."""
+        cutoff = (datetime.now() - timedelta(hours=ttl_hours)).isoformat()
+        expired = [
+            job["id"] for job in self.find()
+            if job.get("status") not in ACTIVE_STATUSES and job.get("updated_at", "") < cutoff
+        ]
+        for job_id in expired:
+            self.delete(job_id)
+        return len(expired)
+
+    def refresh(self, job_id: str) -> Optional[dict]:
+        """Re-reads a job another process may have changed; in-memory jobs are never shared."""
+        return self.get(job_id)
+
+    def forget(self, job_id: str):
+        """
+        Hands a job over to another process (see EXECUTION_MODE=queue).
+        In-memory jobs can't be shared, so they stay where they are.
+        """
+
+    def _persist(self, job_id: str, fields=None):
+        """
+        Hook for durable repositories; fields are the keys that changed,
+        None for the whole job. In-memory jobs need no flushing.
+        """
+
+    def close(self):
+        pass
+
+
+class SQLiteJobRepository(JobRepository):
+    """
+    SQLite-backed job repository.
+
+    Jobs written by this process are kept in memory and flushed by a
+    background writer thread, so update_timeline never waits on disk and
+    bursts of updates to the same job coalesce into one write. Jobs this
+    process hasn't written are read from the database on a connection of
+    their own, which WAL lets read while another connection or process
+    holds the write lock, and reused for JOB_READ_CACHE_SECONDS.
+
+    Writes merge only the fields this process changed into the stored
+    row, and pick up the row's other fields in return, so a worker's
+    progress updates don't overwrite a status the API set (see
+    EXECUTION_MODE=queue), and refresh() re-reads a cached job. A status
+    of "cancelled" is only replaced by a process that had seen it, so a
+    worker's status write racing the API's cancel can't undo it.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB, read_cache_seconds: float = JOB_READ_CACHE_SECONDS):
+        super().__init__()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                file_id TEXT,
+                status TEXT,
+                updated_at TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file_id ON jobs (file_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at)")
+        self._conn.commit()
+        # Reads never queue behind the writer thread's transactions
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.read_cache_seconds = read_cache_seconds
+        # job_id -> (loaded at, job) of jobs read but not held by this process
+        self._read_cache: Dict[str, tuple] = {}
+
+        # job_id -> fields changed since the last write, None for the whole job
+        self._changed: Dict[str, Optional[set]] = {}
+        # job_id -> status last read from or written to the database
+        self._seen_status: Dict[str, Optional[str]] = {}
+        self._dirty: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="job-store-writer", daemon=True)
+        self._writer.start()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = super().get(job_id)
+        if job is not None:
+            return job
+        with self._lock:
+            cached = self._read_cache.get(job_id)
+        if cached is not None and time.monotonic() - cached[0] < self.read_cache_seconds:
+            return cached[1]
+        return self._load(job_id)
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        with self._read_lock:
+            row = self._reader.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        with self._lock:
+            if row is None:
+                self._read_cache.pop(job_id, None)
+                return None
+            job = json.loads(row[0])
+            if job_id not in self._jobs:
+                self._seen_status[job_id] = job.get("status")
+                self._read_cache[job_id] = (time.monotonic(), job)
+                # Expired reads of jobs nobody asks about again are dropped here
+                if len(self._read_cache) > 1000:
+                    cutoff = time.monotonic() - self.read_cache_seconds
+                    self._read_cache = {key: value for key, value in self._read_cache.items()
+                                        if value[0] >= cutoff}
+        return job
+
+    def refresh(self, job_id: str) -> Optional[dict]:
+        """Re-reads a cached job's fields from the database, keeping unwritten local changes."""
+        stored = self._load(job_id)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or stored is None:
+                return job or stored
+            self._merge_into(job, stored)
+            if "status" not in (self._changed.get(job_id) or ()):
+                self._seen_status[job_id] = stored.get("status")
+            return job
+
+    def delete(self, job_id: str):
+        super().delete(job_id)
+        with self._lock:
+            self._changed.pop(job_id, None)
+            self._seen_status.pop(job_id, None)
+            self._read_cache.pop(job_id, None)
+        with self._db_lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def find(self, file_id: str = None, statuses: tuple = None) -> List[dict]:
+        """Blocks until pending writes are flushed; async callers run it in a thread."""
+        self.flush()
+        query = "SELECT data FROM jobs WHERE 1 = 1"
+        params = []
+        if file_id is not None:
+            query += " AND file_id = ?"
+            params.append(file_id)
+        if statuses is not None:
+            query += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params.extend(statuses)
+        with self._read_lock:
+            rows = self._reader.execute(query, params).fetchall()
+        # Jobs this process holds win over the rows just read
+        return [JobRepository.get(self, json.loads(data)["id"]) or json.loads(data) for (data,) in rows]
+
+    def cleanup_expired(self, ttl_hours: float = JOB_TTL_HOURS) -> int:
+        self.flush()
+        cutoff = (datetime.now() - timedelta(hours=ttl_hours)).isoformat()
+        placeholders = ', '.join('?' for _ in ACTIVE_STATUSES)
+        with self._read_lock:
+            expired = [job_id for (job_id,) in self._reader.execute(
+                f"SELECT id FROM jobs WHERE updated_at < ? AND status NOT IN ({placeholders})",
+                (cutoff, *ACTIVE_STATUSES),
+            )]
+        for job_id in expired:
+            self.delete(job_id)
+        return len(expired)
+
+    def forget(self, job_id: str):
+        """
+        Writes the job's changes out and drops it from memory, so later
+        reads come from the database and see updates made by another
+        process. Blocks on the database; async callers run it in a thread.
+        """
+        self.flush()
+        with self._lock:
+            # Written here as well, in case it changed since the flush
+            change = self._take_change(job_id)
+            self._jobs.pop(job_id, None)
+            self._seen_status.pop(job_id, None)
+            self._read_cache.pop(job_id, None)
+        if change is not None:
+            self._write_changes([change])
+
+    def _persist(self, job_id: str, fields=None):
+        with self._lock:
+            # Held in _jobs from now on
+            self._read_cache.pop(job_id, None)
+            if fields is None or (job_id in self._changed and self._changed[job_id] is None):
+                self._changed[job_id] = None
+            else:
+                self._changed.setdefault(job_id, set()).update(fields)
+        self._dirty.put(job_id)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._dirty.get()]
+            # Coalesce everything queued since the last write
+            while True:
+                try:
+                    batch.append(self._dirty.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write({job_id for job_id in batch if job_id is not None})
+            except Exception as e:
+                print(f"Error persisting jobs: {e}")
+            finally:
+                for _ in batch:
+                    self._dirty.task_done()
+            if None in batch:
+                return
+
+    def _row(self, job: dict) -> tuple:
+        return (job["id"], job.get("file_id"), job.get("status"), job.get("updated_at"), json.dumps(job))
+
+    def _take_change(self, job_id: str) -> Optional[tuple]:
+        """
+        (job_id, changed fields or None, serialised values, status last
+        seen) of a pending write. Caller holds _lock.
+        """
+        if job_id not in self._changed or job_id not in self._jobs:
+            return None
+        fields = self._changed.pop(job_id)
+        job = self._jobs[job_id]
+        values = job if fields is None else {key: job.get(key) for key in fields | {"updated_at"}}
+        return job_id, fields, json.dumps(values), self._seen_status.get(job_id)
+
+    def _merge_into(self, job: dict, stored: dict):
+        """Copies stored fields into a cached job, except ones changed locally but not yet written."""
+        pending = self._changed.get(job["id"], set())
+        if pending is None:
+            return
+        for key, value in stored.items():
+            if key not in pending:
+                job[key] = value
+
+    def _write(self, job_ids: set):
+        with self._lock:
+            changes = [change for change in map(self._take_change, job_ids) if change is not None]
+        self._write_changes(changes)
+
+    def _write_changes(self, changes: list):
+        if not changes:
+            return
+        merged = []
+        with self._db_lock:
+            # IMMEDIATE takes the write lock before reading, so no other process
+            # can write a row between our read and our merge
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job_id, fields, values, seen_status in changes:
+                    job = json.loads(values)
+                    row = None
+                    if fields is not None:
+                        row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                    if row is not None:
+                        stored = json.loads(row[0])
+                        if stored.get("status") == "cancelled" and seen_status != "cancelled":
+                            # Cancelled by another process since we last looked
+                            job.pop("status", None)
+                        job = {**stored, **job}
+                    elif fields is not None:
+                        # Deleted elsewhere, or not written yet: nothing to merge into
+                        continue
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO jobs (id, file_id, status, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+                        self._row(job),
+                    )
+                    merged.append(job)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        with self._lock:
+            for job in merged:
+                cached = self._jobs.get(job["id"])
+                if cached is not None:
+                    self._merge_into(cached, job)
+                    if "status" not in (self._changed.get(job["id"]) or ()):
+                        self._seen_status[job["id"]] = job.get("status")
+
+    def flush(self):
+        """Block until every queued write has reached the database."""
+        self._dirty.join()
+
+    def close(self):
+        self._dirty.put(None)
+        self._writer.join(timeout=5)
+        with self._read_lock:
+            self._reader.close()
+
+
+def create_job_repository(kind: str = JOB_STORE) -> JobRepository:
+    if kind == "memory":
+        return JobRepository()
+    if kind == "sqlite":
+        return SQLiteJobRepository()
+    raise ValueError(f"Unknown job store: {kind}")
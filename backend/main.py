@@ -1,17 +1,32 @@
 import os
 import shutil
+import tempfile
+import time
 import uuid
 import json
 import asyncio
+import functools
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pydantic import BaseModel
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from ai_engine import AIEngine
-from video_processor import VideoProcessor
+from video_processor import VideoProcessor, RENDITION_PRESETS
 from metadata_extractor import MetadataExtractor
+from metadata_store import MetadataStore
+from signal_scorer import SignalScorer
+from chunked_upload import ChunkedUploadManager, UploadError
+from preview_cache import PreviewCache, VTT_NAME, MAX_PARALLEL_PREVIEWS
+from segment_cache import SegmentCache
+from media_server import MediaServer
+from file_registry import FileRegistry
+from progress import JobProgress
+from connection_manager import ConnectionManager
+from job_executor import JobExecutor, QueueFullError, JobCancelledError
+from scheduler import PriorityLane, estimate_cost, estimate_render_cost
+from job_store import create_job_repository, ACTIVE_STATUSES, JOB_STORE
+from work_queue import WorkQueue, PENDING_STATES
 
 app = FastAPI(title="Agentic Video Editor API")
 
@@ -24,111 +39,210 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for video playback
+# Uploads and processed videos are served by media_server (see /uploads and /static routes)
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("processed", exist_ok=True)
-app.mount("/static", StaticFiles(directory="processed"), name="static")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 ai_engine = AIEngine()
-video_processor = VideoProcessor()
+# Rendered clips are cached so re-submitting an edit only cuts the changed clips
+SEGMENT_CACHE = os.getenv("SEGMENT_CACHE", "true").lower() == "true"
+video_processor = VideoProcessor(segment_cache=SegmentCache() if SEGMENT_CACHE else None)
 metadata_extractor = MetadataExtractor()
+metadata_store = MetadataStore()
+signal_scorer = SignalScorer(processor=video_processor)
+upload_manager = ChunkedUploadManager("uploads")
+preview_cache = PreviewCache()
+media_server = MediaServer()
+# file_id -> upload path and derived artifacts, so no request lists a directory
+file_registry = FileRegistry("uploads")
+job_executor = JobExecutor(on_cancel=video_processor.cancel)
+# Gemini analysis is network bound, so it is admitted separately from the FFmpeg pool
+analysis_lane = PriorityLane()
+# Previews get a small lane of their own, so a library page full of posters
+# never fills the render queue; key -> generation shared by its requests
+preview_lane = PriorityLane(slots=MAX_PARALLEL_PREVIEWS)
+preview_tasks: Dict[str, asyncio.Task] = {}
 
-# In-memory job store (replace with DB in production)
-jobs = {}
-# WebSocket connections for real-time logs
-# WebSocket Connection Manager
-class ConnectionManager:
-    def __init__(self):
-        # Map job_id to list of active websockets
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, job_id: str, websocket: WebSocket):
-        await websocket.accept()
-        if job_id not in self.active_connections:
-            self.active_connections[job_id] = []
-        self.active_connections[job_id].append(websocket)
-        print(f"Client connected to job {job_id}. Total clients: {len(self.active_connections[job_id])}")
-
-    def disconnect(self, job_id: str, websocket: WebSocket):
-        if job_id in self.active_connections:
-            if websocket in self.active_connections[job_id]:
-                self.active_connections[job_id].remove(websocket)
-            if not self.active_connections[job_id]:
-                del self.active_connections[job_id]
-        print(f"Client disconnected from job {job_id}")
-
-    async def broadcast(self, job_id: str, message: dict):
-        if job_id in self.active_connections:
-            # Create a copy of the list to iterate safely
-            for connection in self.active_connections[job_id][:]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error sending to client: {e}")
-                    self.disconnect(job_id, connection)
+# Job repository (SQLite by default, see JOB_STORE)
+job_store = create_job_repository()
+RESUME_INTERRUPTED_JOBS = os.getenv("RESUME_INTERRUPTED_JOBS", "false").lower() == "true"
 
+# Where analysis and render work runs: "inline" in this process, or "queue"
+# to hand it to worker.py processes through the shared work queue
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "inline")
+# How often queued work is checked for completion and worker events relayed
+WORK_POLL_INTERVAL = float(os.getenv("WORK_POLL_INTERVAL", 0.25))
+if EXECUTION_MODE == "queue" and JOB_STORE != "sqlite":
+    raise ValueError("EXECUTION_MODE=queue needs JOB_STORE=sqlite so workers can share job state")
+work_queue = WorkQueue() if EXECUTION_MODE == "queue" else None
+JOB_CLEANUP_INTERVAL = int(os.getenv("JOB_CLEANUP_INTERVAL", 3600))
+# Children of one batch in flight at once (the pool still interleaves other jobs)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", job_executor.max_workers))
+ANALYSIS_PROXY = os.getenv("ANALYSIS_PROXY", "true").lower() == "true"
+PROXY_DIR = os.getenv("PROXY_DIR", "data/proxies")
+# Videos longer than this are analysed in ANALYSIS_CHUNK_SECONDS windows
+ANALYSIS_CHUNK_THRESHOLD = float(os.getenv("ANALYSIS_CHUNK_THRESHOLD", 1200))
+ANALYSIS_CHUNK_SECONDS = float(os.getenv("ANALYSIS_CHUNK_SECONDS", 600))
+# "gemini" analyses remotely, "local" uses the signal scorer only,
+# "hybrid" sends only the scorer's best candidate windows to Gemini
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "gemini")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 8))
+HYBRID_WINDOW_SECONDS = int(os.getenv("HYBRID_WINDOW_SECONDS", 30))
+# Finished outputs are remuxed with +faststart and packaged as HLS under HLS_DIR
+FASTSTART_OUTPUT = os.getenv("FASTSTART_OUTPUT", "true").lower() == "true"
+HLS_OUTPUT = os.getenv("HLS_OUTPUT", "true").lower() == "true"
+HLS_DIR = "processed/hls"
+os.makedirs(PROXY_DIR, exist_ok=True)
+os.makedirs(HLS_DIR, exist_ok=True)
+# WebSocket connections for real-time logs
 manager = ConnectionManager()
+# file_id -> lock, so jobs on the same upload (e.g. a batch) create its proxy once
+proxy_locks: Dict[str, asyncio.Lock] = {}
+
+def source_metadata(job_id: str) -> dict:
+    """Stored metadata of a job's upload, used to estimate the cost of its work"""
+    job = job_store.get(job_id)
+    return (metadata_store.get(job["file_id"]) if job else None) or {}
+
+def job_group(job_id: str) -> Optional[str]:
+    """Batch a job belongs to, used to share log channels and pool fairness"""
+    job = job_store.get(job_id)
+    return job.get("batch_id") if job else None
+
+def is_cancelled(job_id: str) -> bool:
+    job = job_store.get(job_id)
+    return bool(job) and job.get("status") == "cancelled"
+
+def ensure_not_cancelled(job_id: str):
+    """Stops a job's pipeline between steps once DELETE /jobs/{id} has cancelled it"""
+    if is_cancelled(job_id):
+        raise JobCancelledError(f"Job {job_id} was cancelled")
 
 async def send_log(job_id: str, message: str, level: str = "info"):
-    """Send log message to all connected clients for a job"""
-    await manager.broadcast(job_id, {
+    """Send log message to all connected clients for a job (and its batch)"""
+    entry = {
         "type": "log",
         "level": level,
         "message": message,
         "timestamp": datetime.now().isoformat()
-    })
+    }
+    await manager.broadcast(job_id, entry)
+    batch_id = job_group(job_id)
+    if batch_id:
+        await manager.broadcast(batch_id, {**entry, "job_id": job_id})
 
-async def update_timeline(job_id: str, event: str, status: str = "completed"):
-    """Update timeline event"""
-    if job_id not in jobs:
-        return
-    
-    if "timeline" not in jobs[job_id]:
-        jobs[job_id]["timeline"] = []
-    
-    jobs[job_id]["timeline"].append({
+async def update_timeline(job_id: str, event: str, status: str = "completed", **details):
+    """Update timeline event (details such as duration_seconds are stored on the entry)"""
+    timeline = job_store.append_timeline(job_id, {
         "event": event,
         "status": status,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        **details
     })
+    if timeline is None:
+        return
     
+    # Clients get the full timeline on connect, then only the new entry
     await manager.broadcast(job_id, {
-        "type": "timeline",
-        "timeline": jobs[job_id]["timeline"]
+        "type": "timeline_event",
+        "index": len(timeline) - 1,
+        "entry": timeline[-1]
     })
+    batch_id = job_group(job_id)
+    if batch_id:
+        await manager.broadcast(batch_id, {
+            "type": "child_timeline",
+            "job_id": job_id,
+            **timeline[-1]
+        })
+
+async def send_progress(job_id: str, update: dict):
+    """Broadcast an FFmpeg progress update and keep the latest one on the job"""
+    job_store.update(job_id, progress=update)
+    entry = {"type": "progress", **update, "timestamp": datetime.now().isoformat()}
+    await manager.broadcast(job_id, entry)
+    batch_id = job_group(job_id)
+    if batch_id:
+        await manager.broadcast(batch_id, {**entry, "job_id": job_id})
+
+def watch_progress(job_id: str, loop: asyncio.AbstractEventLoop) -> JobProgress:
+    """
+    Relays a job's FFmpeg progress from pool threads to the event loop:
+    throttled progress messages, and a timeline entry with the duration
+    of every finished stage.
+    """
+    def on_update(update: dict):
+        asyncio.run_coroutine_threadsafe(send_progress(job_id, update), loop)
+
+    def on_stage_finished(stage: str, elapsed: float):
+        asyncio.run_coroutine_threadsafe(
+            update_timeline(job_id, f"Stage {stage.title()} Finished", "completed",
+                            stage=stage, duration_seconds=round(elapsed, 2)),
+            loop,
+        )
+
+    tracker = JobProgress(on_update, on_stage_finished)
+    video_processor.watch(job_id, tracker)
+    return tracker
+
+def find_upload(file_id: str, detail: str = "File not found") -> str:
+    """Upload path of file_id from the registry, or 404"""
+    file_path = file_registry.upload_path(file_id)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return file_path
+
+def job_artifacts(job: dict) -> List[str]:
+    """Processed outputs (and their HLS packages) recorded on a job"""
+    paths = []
+    for url in [job.get("output_url"), *(job.get("renditions") or {}).values()]:
+        if url:
+            filename = os.path.basename(url)
+            paths.extend([f"processed/{filename}", hls_dir_for(filename)])
+    return paths
+
+def derived_artifacts(file_id: str) -> List[str]:
+    """
+    Proxy, previews and job outputs of an upload, worked out from disk and
+    the job store, so outputs written by worker processes are found too
+    """
+    paths = [f"{PROXY_DIR}/{file_id}.mp4", *preview_cache.entries(file_id)]
+    for job in job_store.find(file_id=file_id):
+        paths.extend(job_artifacts(job))
+    return paths
+
+def register_derived_artifacts():
+    """Index proxies, previews and job outputs of the uploads found at startup"""
+    for file_id, file_path in file_registry.uploads().items():
+        file_registry.add_artifact(file_id, f"{PROXY_DIR}/{file_id}.mp4")
+        file_registry.add_artifact(file_id, preview_cache.path_for(preview_cache.key(file_id, file_path)))
+    for job in job_store.find():
+        if job.get("file_id"):
+            for path in job_artifacts(job):
+                file_registry.add_artifact(job["file_id"], path)
+
+@app.on_event("startup")
+async def build_file_registry():
+    await asyncio.to_thread(register_derived_artifacts)
+
+@app.on_event("startup")
+async def sync_metadata_store():
+    """Backfill metadata for uploads the store hasn't seen, off the event loop"""
+    asyncio.create_task(asyncio.to_thread(metadata_store.sync, file_registry.uploads(), metadata_extractor))
 
 @app.get("/")
 async def root():
     return {"message": "Agentic Video Editor API is running"}
 
 @app.get("/videos")
-async def list_videos():
+async def list_videos(limit: Optional[int] = None, offset: int = 0, sort: str = "upload_time", order: str = "desc"):
     """List all uploaded videos with metadata"""
-    videos = []
-    
-    if not os.path.exists("uploads"):
-        return {"videos": []}
-    
-    for filename in os.listdir("uploads"):
-        if filename.startswith('.'):
-            continue
-            
-        file_path = f"uploads/{filename}"
-        # Extract file_id from filename (format: {uuid}_{original_name})
-        parts = filename.split('_', 1)
-        file_id = parts[0] if len(parts) > 0 else filename
-        
-        metadata = metadata_extractor.extract_metadata(file_path)
-        metadata['file_id'] = file_id
-        metadata['path'] = file_path
-        
-        videos.append(metadata)
-    
-    # Sort by upload time (newest first)
-    videos.sort(key=lambda x: x.get('upload_time', ''), reverse=True)
+    try:
+        videos, total = metadata_store.list(limit=limit, offset=offset, sort=sort, order=order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {"videos": videos}
+    return {"videos": videos, "total": total}
 
 @app.get("/processed")
 async def list_processed_videos():
@@ -143,14 +257,19 @@ async def list_processed_videos():
             continue
             
         file_path = f"processed/{filename}"
+        if not os.path.isfile(file_path):
+            continue
         stats = os.stat(file_path)
         
-        videos.append({
+        video = {
             "filename": filename,
             "path": f"/static/{filename}",
             "size_mb": round(stats.st_size / (1024 * 1024), 2),
             "created_at": datetime.fromtimestamp(stats.st_ctime).isoformat()
-        })
+        }
+        if os.path.exists(f"{hls_dir_for(filename)}/index.m3u8"):
+            video["hls_path"] = hls_url_for(filename)
+        videos.append(video)
     
     # Sort by creation time (newest first)
     videos.sort(key=lambda x: x.get('created_at', ''), reverse=True)
@@ -162,53 +281,107 @@ async def delete_processed_video(filename: str):
     """Delete a processed video"""
     file_path = f"processed/{filename}"
     
-    if not os.path.exists(file_path):
+    if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="Video not found")
         
     try:
         os.remove(file_path)
+        shutil.rmtree(hls_dir_for(filename), ignore_errors=True)
+        file_registry.remove_artifact(file_path)
+        file_registry.remove_artifact(hls_dir_for(filename))
         return {"message": "Video deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def resolve_media_path(root: str, relative: str) -> str:
+    """Path of relative inside root; 404 for hidden files or anything outside root"""
+    path = os.path.realpath(os.path.join(root, relative))
+    if not path.startswith(os.path.realpath(root) + os.sep) or os.path.basename(path).startswith('.'):
+        raise HTTPException(status_code=404, detail="Not found")
+    return path
+
+def upload_etag(file_id: str, path: str) -> Optional[str]:
+    """Content hash of an upload from stored metadata, or the remembered hash"""
+    metadata = metadata_store.get(file_id) or {}
+    return metadata.get('sha256') or ai_engine.cache.known_hash(path)
+
+@app.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+async def serve_upload(filename: str, request: Request):
+    """Source videos for the player, with byte ranges and content-hash ETags"""
+    path = resolve_media_path("uploads", filename)
+    try:
+        etag = await asyncio.to_thread(upload_etag, filename.split('_', 1)[0], path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    return await media_server.response(request, path, etag=etag)
+
+@app.api_route("/static/{filename:path}", methods=["GET", "HEAD"])
+async def serve_processed(filename: str, request: Request):
+    return await media_server.response(request, resolve_media_path("processed", filename))
+
+@app.get("/media/stats")
+async def get_media_stats():
+    """Open file handles and per-client streams of the media server"""
+    return media_server.stats()
+
+@app.get("/ws/stats")
+async def get_websocket_stats():
+    """Connected clients, queued messages and slow clients dropped by the WebSocket fan-out"""
+    return manager.stats()
+
+def hls_dir_for(filename: str) -> str:
+    """HLS package of a processed output, named after the MP4 without its extension"""
+    return f"{HLS_DIR}/{os.path.splitext(filename)[0]}"
+
+def hls_url_for(filename: str) -> str:
+    return f"/hls/{os.path.splitext(filename)[0]}/index.m3u8"
+
+@app.api_route("/hls/{output}/{name}", methods=["GET", "HEAD"])
+async def get_hls_file(output: str, name: str, request: Request):
+    """
+    HLS playlists and segments. Segment names are unique per render, so
+    they are cached as immutable; playlists are revalidated.
+    """
+    if name != "index.m3u8" and not (name.startswith("seg_") and name.endswith(".ts")):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = resolve_media_path(HLS_DIR, f"{output}/{name}")
+    if name == "index.m3u8":
+        return await media_server.response(request, path, media_type="application/vnd.apple.mpegurl",
+                                           headers={"Cache-Control": "no-cache"})
+    return await media_server.response(request, path, media_type="video/mp2t",
+                                       headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @app.get("/videos/{file_id}/metadata")
 async def get_video_metadata(file_id: str):
     """Get detailed metadata for a specific video"""
-    files = [f for f in os.listdir("uploads") if f.startswith(file_id)]
-    if not files:
-        raise HTTPException(status_code=404, detail="Video not found")
-    
-    file_path = f"uploads/{files[0]}"
-    metadata = metadata_extractor.extract_metadata(file_path)
-    metadata['file_id'] = file_id
-    metadata['path'] = file_path
-    
-    return metadata
+    file_path = find_upload(file_id, "Video not found")
+    return await asyncio.to_thread(metadata_store.get_or_extract, file_id, file_path, metadata_extractor)
 
 @app.delete("/videos/{file_id}")
 async def delete_video(file_id: str):
-    """Delete a video and its processed output"""
+    """Delete a video and everything derived from it"""
     deleted_files = []
     
-    # Delete original upload
-    upload_files = [f for f in os.listdir("uploads") if f.startswith(file_id)]
-    for filename in upload_files:
-        file_path = f"uploads/{filename}"
-        os.remove(file_path)
-        deleted_files.append(file_path)
-    
-    # Delete processed video if exists
-    if os.path.exists("processed"):
-        processed_files = [f for f in os.listdir("processed") if file_id in f]
-        for filename in processed_files:
-            file_path = f"processed/{filename}"
+    # Artifacts are worked out afresh, as other processes (workers, other
+    # API processes) never report theirs to this registry
+    upload_path = file_registry.upload_path(file_id)
+    _, registered = file_registry.remove(file_id)
+    artifacts = sorted(set(registered) | set(await asyncio.to_thread(derived_artifacts, file_id)))
+    for file_path in [upload_path, *artifacts] if upload_path else artifacts:
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path, ignore_errors=True)
+        elif os.path.exists(file_path):
             os.remove(file_path)
-            deleted_files.append(file_path)
-    
+        else:
+            continue
+        deleted_files.append(file_path)
+
+    metadata_store.delete(file_id)
+    proxy_locks.pop(file_id, None)
+
     # Remove from jobs
-    jobs_to_remove = [job_id for job_id, job in jobs.items() if job.get('file_id') == file_id]
-    for job_id in jobs_to_remove:
-        del jobs[job_id]
+    for job in await asyncio.to_thread(job_store.find, file_id=file_id):
+        await asyncio.to_thread(job_store.delete, job["id"])
     
     if not deleted_files:
         raise HTTPException(status_code=404, detail="Video not found")
@@ -216,7 +389,7 @@ async def delete_video(file_id: str):
     return {"message": "Video deleted successfully", "deleted_files": deleted_files}
 
 @app.post("/upload")
-def upload_video(file: UploadFile = File(...)):
+def upload_video(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     print(f"Receiving upload: {file.filename}")
     file_id = str(uuid.uuid4())
     file_path = f"uploads/{file_id}_{file.filename}"
@@ -229,8 +402,9 @@ def upload_video(file: UploadFile = File(...)):
         print(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
-    # Extract metadata
-    metadata = metadata_extractor.extract_metadata(file_path)
+    file_registry.add_upload(file_id, file_path)
+    metadata = on_upload_complete(file_id, file_path)
+    background_tasks.add_task(prepare_previews, file_id, file_path)
     
     return {
         "id": file_id,
@@ -239,20 +413,269 @@ def upload_video(file: UploadFile = File(...)):
         "metadata": metadata
     }
 
+def on_upload_complete(file_id: str, file_path: str, content_hash: str = None) -> dict:
+    """Post-upload stage: extract metadata once and cache it for the library"""
+    metadata = metadata_extractor.extract_metadata(file_path)
+    metadata['file_id'] = file_id
+    metadata['path'] = file_path
+    if content_hash:
+        metadata['sha256'] = content_hash
+        # Spare the analysis cache from re-hashing a file we just hashed
+        ai_engine.cache.remember_hash(file_path, content_hash)
+    metadata_store.put(file_id, file_path, metadata)
+    return metadata
+
+def ensure_previews(file_id: str, file_path: str) -> Optional[dict]:
+    """Poster and seek sprites of an upload, generated once per file_id and mtime"""
+    metadata = metadata_store.get_or_extract(file_id, file_path, metadata_extractor)
+    key = preview_cache.key(file_id, file_path)
+    file_registry.add_artifact(file_id, preview_cache.path_for(key))
+    return preview_cache.ensure(file_path, key, metadata.get('duration', 0), video_processor)
+
+async def build_previews(key: str, file_id: str, file_path: str) -> Optional[dict]:
+    async with preview_lane.slot(key, estimate_cost("previews", metadata_store.get(file_id))):
+        return await asyncio.to_thread(ensure_previews, file_id, file_path)
+
+async def generate_previews(file_id: str, file_path: str) -> Optional[dict]:
+    """Preview manifest of an upload; on a miss one generation per key runs on the preview lane"""
+    key = preview_cache.key(file_id, file_path)
+    manifest = preview_cache.get(key)
+    if manifest is not None:
+        return manifest
+    task = preview_tasks.get(key)
+    if task is None:
+        task = asyncio.create_task(build_previews(key, file_id, file_path))
+        preview_tasks[key] = task
+        task.add_done_callback(lambda _: preview_tasks.pop(key, None))
+    # A client going away doesn't cancel generation the others wait on
+    return await asyncio.shield(task)
+
+async def prepare_previews(file_id: str, file_path: str):
+    """Post-upload stage: previews are made ahead of the first request"""
+    try:
+        await generate_previews(file_id, file_path)
+    except Exception as e:
+        print(f"Preview generation failed for {file_id}: {e}")
+
+async def preview_file(request: Request, file_id: str, name: str):
+    file_path = find_upload(file_id, "Video not found")
+    try:
+        manifest = await generate_previews(file_id, file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Video not found")
+    path = preview_cache.file_path(manifest["key"], name) if manifest else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Preview not available")
+    media_type = "text/vtt" if name == VTT_NAME else "image/jpeg"
+    return await media_server.response(request, path, media_type=media_type,
+                                       headers={"Cache-Control": "public, max-age=86400"})
+
+@app.get("/videos/{file_id}/poster")
+async def get_video_poster(file_id: str, request: Request):
+    """Poster frame for the library and player, generated on first request if missing"""
+    return await preview_file(request, file_id, "poster.jpg")
+
+@app.get("/videos/{file_id}/sprites/{name}")
+async def get_video_sprite(file_id: str, name: str, request: Request):
+    """Seek sprite sheets and their WebVTT index (thumbnails.vtt)"""
+    return await preview_file(request, file_id, name)
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: int
+
+def get_upload_session(upload_id: str):
+    session = upload_manager.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+@app.post("/upload/init")
+async def init_chunked_upload(request: UploadInitRequest):
+    """Start a resumable upload; the file is preallocated at its final size"""
+    try:
+        session = await asyncio.to_thread(upload_manager.create, request.filename, request.size)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=507, detail=f"Cannot allocate upload: {e}")
+    return session.to_dict()
+
+@app.get("/upload/{upload_id}")
+async def get_chunked_upload(upload_id: str):
+    """Upload progress; resume by sending the next chunk at `offset`"""
+    return get_upload_session(upload_id).to_dict()
+
+@app.put("/upload/{upload_id}")
+async def put_upload_chunk(upload_id: str, offset: int, request: Request):
+    """Write the raw request body at `offset`, straight into the preallocated file"""
+    session = get_upload_session(upload_id)
+    buffer = bytearray()
+    position = offset
+    try:
+        async for data in request.stream():
+            buffer.extend(data)
+            if len(buffer) >= 1024 * 1024:
+                await asyncio.to_thread(session.write, position, bytes(buffer))
+                position += len(buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(session.write, position, bytes(buffer))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return session.to_dict()
+
+@app.post("/upload/{upload_id}/finalize")
+async def finalize_chunked_upload(upload_id: str, background_tasks: BackgroundTasks, sha256: Optional[str] = None):
+    """Complete an upload; metadata and previews are generated in the background"""
+    session = get_upload_session(upload_id)
+    try:
+        content_hash = await asyncio.to_thread(session.finalize, sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    upload_manager.finish(upload_id)
+    file_registry.add_upload(session.file_id, session.final_path)
+    print(f"Upload saved: {session.final_path}")
+
+    background_tasks.add_task(on_upload_complete, session.file_id, session.final_path, content_hash)
+    background_tasks.add_task(prepare_previews, session.file_id, session.final_path)
+    return {
+        "id": session.file_id,
+        "filename": session.filename,
+        "path": session.final_path,
+        "sha256": content_hash,
+    }
+
+@app.delete("/upload/{upload_id}")
+async def abort_chunked_upload(upload_id: str):
+    session = get_upload_session(upload_id)
+    await asyncio.to_thread(session.abort)
+    upload_manager.finish(upload_id)
+    return {"message": "Upload aborted"}
+
+async def prepare_analysis_proxy(job_id: str, file_path: str) -> str:
+    """
+    Path of a low-resolution proxy of file_path for Gemini, cached per
+    file_id. Falls back to the original if the proxy can't be made.
+    """
+    ensure_not_cancelled(job_id)
+    file_id = job_store.get(job_id)["file_id"]
+    proxy_path = f"{PROXY_DIR}/{file_id}.mp4"
+    file_registry.add_artifact(file_id, proxy_path)
+
+    def proxy_is_current():
+        return os.path.exists(proxy_path) and os.path.getmtime(proxy_path) >= os.path.getmtime(file_path)
+
+    if proxy_is_current():
+        await send_log(job_id, "Agent Qazi: Reusing cached analysis proxy")
+        return proxy_path
+
+    async with proxy_locks.setdefault(file_id, asyncio.Lock()):
+        # Another job may have made the proxy while this one waited
+        if proxy_is_current():
+            await send_log(job_id, "Agent Qazi: Reusing cached analysis proxy")
+            return proxy_path
+        ensure_not_cancelled(job_id)
+        await send_log(job_id, "Agent Qazi: Creating low-resolution analysis proxy...")
+        created = await job_executor.run(job_id, video_processor.create_proxy, file_path, proxy_path,
+                                         job_id=job_id, group=job_group(job_id),
+                                         cost=estimate_cost("proxy", source_metadata(job_id)))
+    if created:
+        original_mb = os.path.getsize(file_path) / (1024 * 1024)
+        proxy_mb = os.path.getsize(proxy_path) / (1024 * 1024)
+        await send_log(job_id, f"Agent Qazi: Proxy ready ({proxy_mb:.1f} MB vs {original_mb:.1f} MB original)")
+        return proxy_path
+
+    await send_log(job_id, "Agent Qazi: Proxy creation failed, uploading the original", "warning")
+    return file_path
+
+async def prepare_analysis_chunks(job_id: str, file_path: str, work_dir: str) -> list:
+    """Splits the analysis proxy (or the original) into time windows in work_dir"""
+    source = await prepare_analysis_proxy(job_id, file_path) if ANALYSIS_PROXY else file_path
+    ensure_not_cancelled(job_id)
+    await send_log(job_id, f"Agent Qazi: Splitting video into {ANALYSIS_CHUNK_SECONDS:.0f}s chunks...")
+    chunks = await job_executor.run(job_id, video_processor.split_into_chunks,
+                                    source, work_dir, ANALYSIS_CHUNK_SECONDS, job_id=job_id, group=job_group(job_id),
+                                    cost=estimate_cost("split", source_metadata(job_id)))
+    if not chunks:
+        raise RuntimeError("Could not split video into chunks")
+    return chunks
+
+async def score_candidates(job_id: str, file_path: str, window_seconds: int, max_segments: int) -> list:
+    """Ranks windows locally with the signal scorer on the FFmpeg worker pool"""
+    await send_log(job_id, "Agent Qazi: Scoring scene changes, loudness and motion locally...")
+    started = time.monotonic()
+    candidates = await job_executor.run(job_id, signal_scorer.find_highlights, file_path, window_seconds, max_segments,
+                                        job_id=job_id, group=job_group(job_id),
+                                        cost=estimate_cost("score", source_metadata(job_id)))
+    await send_log(job_id, f"Agent Qazi: Local scoring found {len(candidates)} candidates "
+                           f"in {time.monotonic() - started:.1f}s")
+    return candidates
+
+async def prepare_candidate_windows(job_id: str, file_path: str, work_dir: str) -> list:
+    """Cuts the scorer's best windows out of the analysis proxy for Gemini"""
+    candidates = await score_candidates(job_id, file_path, HYBRID_WINDOW_SECONDS, HYBRID_CANDIDATES)
+    if not candidates:
+        raise RuntimeError("Local scoring found no candidate windows")
+    source = await prepare_analysis_proxy(job_id, file_path) if ANALYSIS_PROXY else file_path
+    ensure_not_cancelled(job_id)
+    windows = [(c["start"], c["end"]) for c in candidates]
+    seconds = sum(end - start for start, end in windows)
+    return await job_executor.run(job_id, video_processor.extract_windows, source, windows, work_dir,
+                                  job_id=job_id, group=job_group(job_id),
+                                  cost=estimate_cost("windows", source_metadata(job_id), seconds))
+
+async def find_highlights(job_id: str, file_path: str) -> list:
+    """Runs the configured analysis mode and returns highlights on the source timeline"""
+    log = functools.partial(send_log, job_id)
+    if ANALYSIS_MODE == "local":
+        return await score_candidates(job_id, file_path, 10, 5)
+
+    metadata = metadata_store.get(job_store.get(job_id)["file_id"]) or {}
+    if ANALYSIS_MODE == "hybrid":
+        prepare_chunks = prepare_candidate_windows
+        cache_variant = "hybrid"
+    elif metadata.get("duration", 0) > ANALYSIS_CHUNK_THRESHOLD:
+        prepare_chunks = prepare_analysis_chunks
+        cache_variant = "chunks"
+    else:
+        prepare_upload = functools.partial(prepare_analysis_proxy, job_id, file_path) if ANALYSIS_PROXY else None
+        return await ai_engine.analyze_video(file_path, log=log, prepare_upload=prepare_upload)
+
+    work_dir = tempfile.mkdtemp(prefix=f"chunks_{job_id}_")
+    try:
+        return await ai_engine.analyze_video_chunked(
+            file_path,
+            functools.partial(prepare_chunks, job_id, file_path, work_dir),
+            log=log,
+            cache_variant=cache_variant,
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
 async def run_analysis_agent(job_id: str, file_path: str):
     """Agent Qazi: Analyzes video and finds highlights"""
-    jobs[job_id]["status"] = "analyzing"
+    if is_cancelled(job_id):
+        return False
+    job_store.update(job_id, status="analyzing")
     await update_timeline(job_id, "Analysis Started", "in_progress")
     await send_log(job_id, f"Starting AI analysis of video: {file_path}")
     
     try:
-        await send_log(job_id, "Agent Qazi: Uploading video to Gemini...")
-        highlights = await ai_engine.analyze_video(file_path)
-        jobs[job_id]["highlights"] = highlights
+        if ANALYSIS_MODE == "local":
+            highlights = await find_highlights(job_id, file_path)
+        else:
+            if not analysis_lane.has_capacity():
+                await send_log(job_id, "Agent Qazi: Waiting for an analysis slot...")
+            cost = estimate_cost("analysis", source_metadata(job_id))
+            async with analysis_lane.slot(job_id, cost):
+                highlights = await find_highlights(job_id, file_path)
+        # Gemini calls can't be killed, so a cancel lands here at the latest
+        ensure_not_cancelled(job_id)
+        job_store.update(job_id, highlights=highlights)
         
         if not highlights:
-            jobs[job_id]["status"] = "failed"
-            jobs[job_id]["error"] = "No highlights found"
+            job_store.update(job_id, status="failed", error="No highlights found")
             await update_timeline(job_id, "Analysis Failed", "failed")
             await send_log(job_id, "No highlights detected in video", "error")
             return False
@@ -263,47 +686,124 @@ async def run_analysis_agent(job_id: str, file_path: str):
         
         await update_timeline(job_id, "Analysis Complete", "completed")
         return True
+    except JobCancelledError:
+        await update_timeline(job_id, "Analysis Cancelled", "failed")
+        await send_log(job_id, "Agent Qazi: Job cancelled", "warning")
+        return False
     except Exception as e:
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
+        if is_cancelled(job_id):
+            # The cancel killed the step that failed; keep the job cancelled
+            await update_timeline(job_id, "Analysis Cancelled", "failed")
+            await send_log(job_id, "Agent Qazi: Job cancelled", "warning")
+            return False
+        job_store.update(job_id, status="failed", error=str(e))
         await update_timeline(job_id, "Analysis Error", "failed")
         await send_log(job_id, f"Analysis Error: {str(e)}", "error")
         return False
 
 async def run_processing_agent(job_id: str, file_path: str):
     """Agent Trond: Cuts and processes video based on highlights"""
-    if "highlights" not in jobs[job_id] or not jobs[job_id]["highlights"]:
+    job = job_store.get(job_id)
+    if job.get("status") == "cancelled":
+        return False
+
+    if not job.get("highlights"):
         await send_log(job_id, "Agent Trond: No highlights found to process!", "error")
         return False
 
-    jobs[job_id]["status"] = "processing"
-    await update_timeline(job_id, "Video Processing Started", "in_progress")
+    job_store.update(job_id, status="queued")
+    await update_timeline(job_id, "Video Processing Queued", "in_progress")
     
     try:
-        highlights = jobs[job_id]["highlights"]
-        await send_log(job_id, "Agent Trond: Starting video processing with FFmpeg...")
+        highlights = job["highlights"]
         output_filename = f"processed_{job_id}.mp4"
         output_path = f"processed/{output_filename}"
-        
-        await send_log(job_id, f"Agent Trond: Cutting {len(highlights)} video segments...")
-        success = video_processor.process_highlights(file_path, highlights, output_path)
-        
+        # One output per requested preset, all encoded from a single decode of the highlights
+        renditions = {
+            name: f"processed/processed_{job_id}_{name}.mp4" for name in job.get("rendition_presets") or []
+        }
+
+        loop = asyncio.get_running_loop()
+
+        def process():
+            # Runs on a pool thread once a worker is free
+            ensure_not_cancelled(job_id)
+            job_store.update(job_id, status="processing")
+            watch_progress(job_id, loop)
+            try:
+                content_hash = None
+                # Hashing reads the whole source, so only when the cache will be used
+                if video_processor.uses_segment_cache(renditions):
+                    metadata = metadata_store.get(job["file_id"]) or {}
+                    content_hash = metadata.get('sha256') or ai_engine.cache.content_hash(file_path)
+                if not video_processor.process_highlights(file_path, highlights, output_path, job_id,
+                                                          renditions=renditions or None,
+                                                          content_hash=content_hash):
+                    return False, {}
+                # Package every output; a packaging failure still leaves a playable MP4
+                hls_urls = {}
+                for path in renditions.values() if renditions else [output_path]:
+                    filename = os.path.basename(path)
+                    hls_dir = hls_dir_for(filename) if HLS_OUTPUT else None
+                    packaged = video_processor.package_output(path, hls_dir, FASTSTART_OUTPUT, job_id)
+                    if packaged and hls_dir:
+                        hls_urls[filename] = hls_url_for(filename)
+                return True, hls_urls
+            finally:
+                video_processor.unwatch(job_id)
+
+        await send_log(job_id, f"Agent Trond: Queued {len(highlights)} video segments for FFmpeg...")
+        started = time.monotonic()
+        cost = estimate_render_cost(source_metadata(job_id), highlights, max(1, len(renditions)),
+                                    copy_original=video_processor.append_strategy == "stream_copy")
+        success, hls_urls = await job_executor.run(job_id, process, group=job_group(job_id), cost=cost)
+        elapsed = round(time.monotonic() - started, 2)
+
+        ensure_not_cancelled(job_id)
+
         if success:
-            jobs[job_id]["status"] = "completed"
-            jobs[job_id]["output_url"] = f"/static/{output_filename}"
-            await update_timeline(job_id, "Processing Complete", "completed")
+            for path in renditions.values() if renditions else [output_path]:
+                file_registry.add_artifact(job["file_id"], path)
+                file_registry.add_artifact(job["file_id"], hls_dir_for(os.path.basename(path)))
+
+        if success and renditions:
+            urls = {name: f"/static/{os.path.basename(path)}" for name, path in renditions.items()}
+            output_filename = os.path.basename(next(iter(renditions.values())))
+            hls = {name: hls_urls[os.path.basename(path)]
+                   for name, path in renditions.items() if os.path.basename(path) in hls_urls}
+            job_store.update(job_id, status="completed", renditions=urls, output_url=f"/static/{output_filename}",
+                             hls_url=hls_urls.get(output_filename), hls_renditions=hls)
+            await update_timeline(job_id, "Processing Complete", "completed", duration_seconds=elapsed)
+            await send_log(job_id, f"✓ Rendered {len(urls)} renditions: {', '.join(urls)}", "success")
+            return True
+        elif success:
+            job_store.update(job_id, status="completed", output_url=f"/static/{output_filename}",
+                             hls_url=hls_urls.get(output_filename))
+            await update_timeline(job_id, "Processing Complete", "completed", duration_seconds=elapsed)
             await send_log(job_id, f"✓ Video processing complete! Output: {output_filename}", "success")
             return True
         else:
-            jobs[job_id]["status"] = "failed"
-            jobs[job_id]["error"] = "Video processing failed"
+            job_store.update(job_id, status="failed", error="Video processing failed")
             await update_timeline(job_id, "Processing Failed", "failed")
             await send_log(job_id, "Video processing failed", "error")
             return False
-            
+
+    except QueueFullError as e:
+        job_store.update(job_id, status="failed", error=str(e))
+        await update_timeline(job_id, "Processing Rejected", "failed")
+        await send_log(job_id, f"Processing Error: {str(e)}", "error")
+        return False
+    except JobCancelledError:
+        job_store.update(job_id, status="cancelled")
+        await update_timeline(job_id, "Processing Cancelled", "failed")
+        await send_log(job_id, "Agent Trond: Job cancelled", "warning")
+        return False
     except Exception as e:
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
+        if is_cancelled(job_id):
+            await update_timeline(job_id, "Processing Cancelled", "failed")
+            await send_log(job_id, "Agent Trond: Job cancelled", "warning")
+            return False
+        job_store.update(job_id, status="failed", error=str(e))
         await update_timeline(job_id, "Processing Error", "failed")
         await send_log(job_id, f"Processing Error: {str(e)}", "error")
         return False
@@ -313,30 +813,169 @@ async def process_video_task(job_id: str, file_path: str):
     if await run_analysis_agent(job_id, file_path):
         await run_processing_agent(job_id, file_path)
 
+# Work a job can be handed to a worker for (see worker.py)
+TASK_RUNNERS = {
+    "process": process_video_task,
+    "analysis": run_analysis_agent,
+    "render": run_processing_agent,
+}
+
+async def run_pipeline(kind: str, job_id: str, file_path: str):
+    """
+    Runs one of TASK_RUNNERS in this process. A cancellation stays in
+    force for every step of the pipeline and is cleared once it ends,
+    so a later re-render of the job isn't cancelled on arrival.
+    """
+    try:
+        return await TASK_RUNNERS[kind](job_id, file_path)
+    finally:
+        video_processor.release(job_id)
+
+def task_cost(kind: str, job_id: str) -> float:
+    """Estimated seconds of a job's work, used to order the shared work queue"""
+    job = job_store.get(job_id) or {}
+    metadata = source_metadata(job_id)
+    cost = 0.0
+    if kind in ("process", "analysis"):
+        cost += estimate_cost("analysis", metadata)
+    if kind in ("process", "render"):
+        cost += estimate_render_cost(metadata, job.get("highlights") or [],
+                                     max(1, len(job.get("rendition_presets") or [])),
+                                     copy_original=video_processor.append_strategy == "stream_copy")
+    return cost
+
+async def execute(kind: str, job_id: str, file_path: str):
+    """
+    Runs one of TASK_RUNNERS for a job. In queue mode the work goes to a
+    worker instead; this waits for it to finish, and its logs reach
+    WebSocket clients through relay_worker_events.
+    """
+    if work_queue is None:
+        return await run_pipeline(kind, job_id, file_path)
+
+    cost = task_cost(kind, job_id)
+    # Let the worker read the job from the database from now on
+    await asyncio.to_thread(job_store.forget, job_id)
+    task_id = await asyncio.to_thread(work_queue.enqueue, job_id, kind, {"file_path": file_path}, cost)
+    while True:
+        state = await asyncio.to_thread(work_queue.state, task_id)
+        if state not in PENDING_STATES:
+            break
+        await asyncio.sleep(WORK_POLL_INTERVAL)
+
+    job = job_store.get(job_id)
+    if state == "failed" and job and job.get("status") in ACTIVE_STATUSES:
+        job_store.update(job_id, status="failed", error="Worker failed to finish the job")
+        await update_timeline(job_id, "Worker Failed", "failed")
+        await asyncio.to_thread(job_store.forget, job_id)
+    return state == "done"
+
+async def resume_job(job: dict):
+    """Re-run an interrupted job from the last stage it reached"""
+    file_path = file_registry.upload_path(job["file_id"])
+    if file_path is None:
+        job_store.update(job["id"], status="interrupted", error="Source video no longer exists")
+        return
+    await update_timeline(job["id"], "Job Resumed After Restart", "completed")
+    if job.get("highlights"):
+        await execute("render", job["id"], file_path)
+    elif job.get("type") == "analysis":
+        await execute("analysis", job["id"], file_path)
+    else:
+        await execute("process", job["id"], file_path)
+
+@app.on_event("startup")
+async def recover_interrupted_jobs():
+    """Jobs that were running when the server stopped are resumed or marked interrupted"""
+    for job in await asyncio.to_thread(job_store.find, statuses=ACTIVE_STATUSES):
+        # Work already handed to the shared queue is picked up by a worker
+        if work_queue is not None and await asyncio.to_thread(work_queue.has_pending, job["id"]):
+            continue
+        # Batch children are recovered individually; the batch itself can't resume
+        if RESUME_INTERRUPTED_JOBS and job.get("type") != "batch":
+            asyncio.create_task(resume_job(job))
+        else:
+            job_store.update(job["id"], status="interrupted", error="Server restarted while job was running")
+            await update_timeline(job["id"], "Job Interrupted", "failed")
+
+@app.on_event("startup")
+async def schedule_job_cleanup():
+    """Periodically drop finished jobs older than JOB_TTL_HOURS and idle chunked uploads"""
+    async def cleanup_loop():
+        while True:
+            removed = await asyncio.to_thread(job_store.cleanup_expired)
+            if removed:
+                print(f"Removed {removed} expired jobs")
+            removed = await asyncio.to_thread(upload_manager.cleanup_expired)
+            if removed:
+                print(f"Removed {removed} idle uploads")
+            await asyncio.sleep(JOB_CLEANUP_INTERVAL)
+    asyncio.create_task(cleanup_loop())
+
+@app.on_event("startup")
+async def relay_worker_events():
+    """In queue mode, forwards the log, progress and timeline messages workers publish"""
+    if work_queue is None:
+        return
+
+    async def relay_loop():
+        last_id = await asyncio.to_thread(work_queue.last_event_id)
+        last_prune = time.monotonic()
+        while True:
+            try:
+                events = await asyncio.to_thread(work_queue.events_since, last_id)
+            except Exception as e:
+                print(f"Error reading worker events: {e}")
+                events = []
+            for event_id, channel, message in events:
+                await manager.broadcast(channel, message)
+                last_id = event_id
+            if time.monotonic() - last_prune >= JOB_CLEANUP_INTERVAL:
+                await asyncio.to_thread(work_queue.prune)
+                last_prune = time.monotonic()
+            if not events:
+                await asyncio.sleep(WORK_POLL_INTERVAL)
+    asyncio.create_task(relay_loop())
+
+@app.on_event("shutdown")
+async def close_job_store():
+    job_store.close()
+    if work_queue is not None:
+        work_queue.close()
+
+async def ensure_queue_capacity():
+    """Reject new work up front instead of accepting jobs the pool cannot queue"""
+    if work_queue is not None:
+        full = await asyncio.to_thread(work_queue.queued_count) >= job_executor.max_queue
+    else:
+        full = job_executor.is_full()
+    if full:
+        raise HTTPException(status_code=503, detail="Processing queue is full, try again later")
+
 @app.post("/process/{file_id}")
-async def start_processing(file_id: str, background_tasks: BackgroundTasks):
-    # Find file (in a real app, look up in DB)
-    files = [f for f in os.listdir("uploads") if f.startswith(file_id)]
-    if not files:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    file_path = f"uploads/{files[0]}"
+async def start_processing(file_id: str, background_tasks: BackgroundTasks,
+                           renditions: Optional[List[str]] = Query(None)):
+    await ensure_queue_capacity()
+    validate_renditions(renditions)
+    file_path = find_upload(file_id)
     job_id = str(uuid.uuid4())
     
-    jobs[job_id] = {
+    job = job_store.create({
         "id": job_id,
         "file_id": file_id,
+        "type": "agentic",
         "status": "queued",
+        "rendition_presets": renditions,
         "timeline": [{
             "event": "Video Uploaded",
             "status": "completed",
             "timestamp": datetime.now().isoformat()
         }]
-    }
+    })
     
-    background_tasks.add_task(process_video_task, job_id, file_path)
+    background_tasks.add_task(execute, "process", job_id, file_path)
     
-    return jobs[job_id]
+    return job
 
 class Clip(BaseModel):
     start: float
@@ -345,102 +984,274 @@ class Clip(BaseModel):
 
 class ManualProcessRequest(BaseModel):
     clips: List[Clip]
+    # Output presets (see GET /renditions); empty means one processed_{job_id}.mp4
+    renditions: Optional[List[str]] = None
+
+def validate_renditions(renditions: Optional[List[str]]):
+    unknown = [name for name in renditions or [] if name not in RENDITION_PRESETS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown rendition presets: {', '.join(unknown)}")
+
+@app.get("/renditions")
+async def list_renditions():
+    """Output presets that can be requested for a job"""
+    return {"presets": RENDITION_PRESETS}
+
+class BatchItem(BaseModel):
+    file_id: str
+    # Clips make this a manual job; without them the item is analysed by Qazi first
+    clips: Optional[List[Clip]] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+
+def batch_summary(batch: dict) -> dict:
+    """Batch job with aggregate progress, throughput and wall time of its children"""
+    summary = dict(batch)
+    counts: Dict[str, int] = {}
+    for child_id in batch["children"]:
+        child = job_store.get(child_id)
+        status = child.get("status", "unknown") if child else "deleted"
+        counts[status] = counts.get(status, 0) + 1
+
+    total = len(batch["children"])
+    finished = sum(n for status, n in counts.items() if status not in ACTIVE_STATUSES)
+    summary["counts"] = counts
+    summary["progress"] = round(100 * finished / total, 1) if total else 100.0
+
+    started_at = batch.get("started_at")
+    if started_at:
+        end = datetime.fromisoformat(batch["finished_at"]) if batch.get("finished_at") else datetime.now()
+        elapsed = (end - datetime.fromisoformat(started_at)).total_seconds()
+        summary["wall_time_seconds"] = round(elapsed, 1)
+        summary["throughput_per_minute"] = round(60 * finished / elapsed, 2) if elapsed > 0 else 0.0
+    return summary
+
+async def run_batch(batch_id: str, children: List[tuple]):
+    """Runs child jobs a few at a time; the pool interleaves them fairly with other work"""
+    job_store.update(batch_id, status="processing", started_at=datetime.now().isoformat())
+    await update_timeline(batch_id, "Batch Started", "in_progress")
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_child(child_id: str, file_path: str, manual: bool):
+        async with slots:
+            if job_store.get(child_id).get("status") == "cancelled":
+                return
+            await execute("render" if manual else "process", child_id, file_path)
+        summary = batch_summary(job_store.get(batch_id))
+        await manager.broadcast(batch_id, {
+            "type": "batch_progress",
+            "job_id": child_id,
+            "progress": summary["progress"],
+            "counts": summary["counts"],
+            "throughput_per_minute": summary.get("throughput_per_minute"),
+        })
+
+    await asyncio.gather(*(run_child(*child) for child in children))
+
+    summary = batch_summary(job_store.get(batch_id))
+    succeeded = summary["counts"].get("completed", 0)
+    if job_store.get(batch_id).get("status") == "cancelled":
+        status = "cancelled"
+    elif succeeded == len(children):
+        status = "completed"
+    elif succeeded:
+        status = "partial"
+    else:
+        status = "failed"
+    job_store.update(batch_id, status=status, finished_at=datetime.now().isoformat())
+    summary = batch_summary(job_store.get(batch_id))
+    await update_timeline(batch_id, f"Batch {status.title()}", "completed" if status == "completed" else "failed")
+    await send_log(batch_id, f"Batch finished: {succeeded}/{len(children)} jobs completed "
+                             f"in {summary['wall_time_seconds']}s", "success" if succeeded else "error")
+
+@app.post("/batch")
+async def start_batch(request: BatchRequest, background_tasks: BackgroundTasks):
+    """Create a batch job with one child job per file (agentic, or manual when clips are given)"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+
+    uploads = file_registry.uploads()
+    missing = [item.file_id for item in request.items if item.file_id not in uploads]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Files not found: {', '.join(missing)}")
+
+    batch_id = str(uuid.uuid4())
+    children = []
+    for item in request.items:
+        child_id = str(uuid.uuid4())
+        manual = bool(item.clips)
+        child = {
+            "id": child_id,
+            "file_id": item.file_id,
+            "batch_id": batch_id,
+            "type": "manual" if manual else "agentic",
+            "status": "queued",
+            "timeline": [{
+                "event": "Added To Batch",
+                "status": "completed",
+                "timestamp": datetime.now().isoformat()
+            }]
+        }
+        if manual:
+            child["highlights"] = [clip.dict() for clip in item.clips]
+        job_store.create(child)
+        children.append((child_id, uploads[item.file_id], manual))
+
+    batch = job_store.create({
+        "id": batch_id,
+        "type": "batch",
+        "status": "queued",
+        "children": [child[0] for child in children],
+        "timeline": [{
+            "event": "Batch Received",
+            "status": "completed",
+            "timestamp": datetime.now().isoformat()
+        }]
+    })
+
+    background_tasks.add_task(run_batch, batch_id, children)
+    return batch_summary(batch)
 
 @app.post("/process/manual/{file_id}")
 async def start_manual_processing(file_id: str, request: ManualProcessRequest, background_tasks: BackgroundTasks):
     """Start manual processing with user-defined clips"""
-    files = [f for f in os.listdir("uploads") if f.startswith(file_id)]
-    if not files:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    file_path = f"uploads/{files[0]}"
+    await ensure_queue_capacity()
+    validate_renditions(request.renditions)
+    file_path = find_upload(file_id)
     job_id = str(uuid.uuid4())
     
     # Convert Pydantic models to dicts
     highlights = [clip.dict() for clip in request.clips]
     
-    jobs[job_id] = {
+    job = job_store.create({
         "id": job_id,
         "file_id": file_id,
+        "type": "manual",
         "status": "queued",
         "highlights": highlights,
+        "rendition_presets": request.renditions,
         "timeline": [{
             "event": "Manual Clips Received",
             "status": "completed",
             "timestamp": datetime.now().isoformat()
         }]
-    }
+    })
     
     # Skip analysis, go straight to processing
-    background_tasks.add_task(run_processing_agent, job_id, file_path)
+    background_tasks.add_task(execute, "render", job_id, file_path)
     
-    return jobs[job_id]
+    return job
 
 @app.post("/agent/qazi/{file_id}")
 async def invoke_qazi(file_id: str, background_tasks: BackgroundTasks):
     """Invoke Agent Qazi (Analysis Only)"""
-    files = [f for f in os.listdir("uploads") if f.startswith(file_id)]
-    if not files:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    file_path = f"uploads/{files[0]}"
+    file_path = find_upload(file_id)
     job_id = str(uuid.uuid4())
     
-    jobs[job_id] = {
+    job = job_store.create({
         "id": job_id,
         "file_id": file_id,
+        "type": "analysis",
         "status": "queued",
         "timeline": [{
             "event": "Agent Qazi Summoned",
             "status": "completed",
             "timestamp": datetime.now().isoformat()
         }]
-    }
+    })
     
-    background_tasks.add_task(run_analysis_agent, job_id, file_path)
-    return jobs[job_id]
+    background_tasks.add_task(execute, "analysis", job_id, file_path)
+    return job
 
 @app.post("/agent/trond/{job_id}")
-async def invoke_trond(job_id: str, background_tasks: BackgroundTasks):
+async def invoke_trond(job_id: str, background_tasks: BackgroundTasks,
+                       renditions: Optional[List[str]] = Query(None)):
     """Invoke Agent Trond (Processing Only - requires existing job with highlights)"""
-    if job_id not in jobs:
+    job = job_store.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job = jobs[job_id]
-    files = [f for f in os.listdir("uploads") if f.startswith(job['file_id'])]
-    if not files:
-        raise HTTPException(status_code=404, detail="File not found")
-        
-    file_path = f"uploads/{files[0]}"
+    await ensure_queue_capacity()
+    file_path = find_upload(job['file_id'])
     
+    validate_renditions(renditions)
     # Reset status for processing
-    job["status"] = "queued"
+    if renditions:
+        job_store.update(job_id, status="queued", rendition_presets=renditions)
+    else:
+        job_store.update(job_id, status="queued")
     await update_timeline(job_id, "Agent Trond Summoned", "completed")
     
-    background_tasks.add_task(run_processing_agent, job_id, file_path)
-    return job
+    background_tasks.add_task(execute, "render", job_id, file_path)
+    return job_store.get(job_id)
 
 @app.get("/jobs/{job_id}")
 async def get_job_status(job_id: str):
-    if job_id not in jobs:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.get("type") == "batch":
+        return batch_summary(job)
+    job = dict(job)
+    if work_queue is not None:
+        position = await asyncio.to_thread(work_queue.queue_position, job_id)
+    else:
+        position = job_executor.queue_position(job_id)
+    if position is not None:
+        job["queue_position"] = position
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job, killing its ffmpeg process"""
+    job = job_store.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return jobs[job_id]
+
+    if job.get("status") not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+
+    job = job_store.update(job_id, status="cancelled")
+    await cancel_work(job_id)
+    for child_id in job.get("children", []):
+        child = job_store.get(child_id)
+        if child and child.get("status") in ACTIVE_STATUSES:
+            job_store.update(child_id, status="cancelled")
+            await cancel_work(child_id)
+    await send_log(job_id, "Cancellation requested", "warning")
+    return job
+
+async def cancel_work(job_id: str):
+    """Stops a job's queued or running work, here or on whichever worker holds it"""
+    job_executor.cancel(job_id)
+    if work_queue is not None:
+        await asyncio.to_thread(work_queue.cancel, job_id)
+        await asyncio.to_thread(job_store.forget, job_id)
+
+@app.get("/queue")
+async def get_queue_stats():
+    """Queue depth, wait times and utilisation of the render, analysis and preview lanes"""
+    stats = {
+        "render": job_executor.stats(),
+        "analysis": analysis_lane.stats(),
+        "previews": preview_lane.stats(),
+    }
+    if work_queue is not None:
+        stats["workers"] = await asyncio.to_thread(work_queue.stats)
+    return stats
 
 @app.websocket("/ws/{job_id}")
 async def websocket_endpoint(websocket: WebSocket, job_id: str):
     await manager.connect(job_id, websocket)
     
     # Send initial timeline if job exists
-    if job_id in jobs and "timeline" in jobs[job_id]:
-        try:
-            await websocket.send_json({
-                "type": "timeline",
-                "timeline": jobs[job_id]["timeline"]
-            })
-        except Exception as e:
-            print(f"Failed to send initial timeline: {e}")
-            manager.disconnect(job_id, websocket)
-            return
+    job = job_store.get(job_id)
+    if job and "timeline" in job:
+        manager.send(job_id, websocket, {
+            "type": "timeline",
+            "timeline": job["timeline"]
+        })
     
     try:
         while True:
@@ -0,0 +1,314 @@
+import os
+import stat as stat_module
+import time
+import asyncio
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.responses import Response, StreamingResponse
+
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", 256 * 1024))
+MEDIA_MAX_OPEN_FILES = int(os.getenv("MEDIA_MAX_OPEN_FILES", 64))
+# Concurrent responses per client address; further requests get 429
+MEDIA_MAX_STREAMS_PER_CLIENT = int(os.getenv("MEDIA_MAX_STREAMS_PER_CLIENT", 8))
+# Bytes per second shared by all of one client's responses (0 = unlimited)
+MEDIA_CLIENT_BANDWIDTH = int(os.getenv("MEDIA_CLIENT_BANDWIDTH", 0))
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class _Handle:
+    def __init__(self, path: str, stat: os.stat_result):
+        self.path = path
+        self.file = open(path, "rb", buffering=0)
+        self.fd = self.file.fileno()
+        self.stat = stat
+        self.refs = 0
+        self.stale = False
+
+
+class FileHandleCache:
+    """
+    Shares one open file descriptor per file across concurrent responses.
+
+    Reads use os.pread, which takes an explicit offset, so any number of
+    range requests can read through the same descriptor. A handle is
+    reopened when the file's inode, size or mtime changes, and idle
+    handles are closed least-recently-used past max_open.
+    """
+
+    def __init__(self, max_open: int = MEDIA_MAX_OPEN_FILES):
+        self.max_open = max_open
+        self._handles: "OrderedDict[str, _Handle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, path: str) -> _Handle:
+        """Raises FileNotFoundError (or IsADirectoryError) like open()."""
+        stat = os.stat(path)
+        if not stat_module.S_ISREG(stat.st_mode):
+            raise IsADirectoryError(path)
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is not None and (handle.stat.st_ino, handle.stat.st_size, handle.stat.st_mtime_ns) != \
+                    (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+                # File was replaced or rewritten; close once in-flight reads finish
+                del self._handles[path]
+                handle.stale = True
+                if handle.refs == 0:
+                    handle.file.close()
+                handle = None
+            if handle is None:
+                handle = _Handle(path, stat)
+                self._handles[path] = handle
+            self._handles.move_to_end(path)
+            handle.refs += 1
+            self._evict()
+            return handle
+
+    def release(self, handle: _Handle):
+        with self._lock:
+            handle.refs -= 1
+            if handle.refs == 0 and handle.stale:
+                handle.file.close()
+            self._evict()
+
+    def _evict(self):
+        idle = [path for path, handle in self._handles.items() if handle.refs == 0]
+        while len(self._handles) > self.max_open and idle:
+            handle = self._handles.pop(idle.pop(0))
+            handle.file.close()
+
+    def open_count(self) -> int:
+        with self._lock:
+            return len(self._handles)
+
+
+class _ClientState:
+    def __init__(self):
+        self.streams = 0
+        self.allowance = 0.0
+        self.last = time.monotonic()
+
+
+class ClientLimiter:
+    """Per-client stream count and a token bucket shared by the client's responses."""
+
+    def __init__(self, max_streams: int = MEDIA_MAX_STREAMS_PER_CLIENT, bandwidth: int = MEDIA_CLIENT_BANDWIDTH):
+        self.max_streams = max_streams
+        self.bandwidth = bandwidth
+        self._clients: Dict[str, _ClientState] = {}
+
+    def open(self, client: str) -> bool:
+        state = self._clients.setdefault(client, _ClientState())
+        if self.max_streams and state.streams >= self.max_streams:
+            return False
+        state.streams += 1
+        return True
+
+    def close(self, client: str):
+        state = self._clients.get(client)
+        if state is None:
+            return
+        state.streams -= 1
+        if state.streams <= 0:
+            del self._clients[client]
+
+    async def throttle(self, client: str, nbytes: int):
+        """Sleeps until the client may send nbytes more."""
+        if not self.bandwidth:
+            return
+        state = self._clients.get(client)
+        if state is None:
+            return
+        now = time.monotonic()
+        # Allow at most one second of burst
+        state.allowance = min(self.bandwidth, state.allowance + (now - state.last) * self.bandwidth)
+        state.last = now
+        state.allowance -= nbytes
+        if state.allowance < 0:
+            await asyncio.sleep(-state.allowance / self.bandwidth)
+
+    def stats(self) -> dict:
+        return {client: state.streams for client, state in self._clients.items()}
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single "bytes=" range. Returns None for
+    headers we ignore (multiple ranges, other units, malformed), and
+    raises ValueError when the range can't be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last) or not (first + last).isdigit():
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+class MediaResponse(StreamingResponse):
+    """
+    Streams [start, end] of a cached file handle. Uses the ASGI zero-copy
+    send extension when the server offers it, otherwise pread chunks.
+    """
+
+    def __init__(self, server: "MediaServer", handle: _Handle, client: str, start: int, end: int,
+                 status_code: int, headers: dict, media_type: str, head: bool = False):
+        self.server = server
+        self.handle = handle
+        self.client = client
+        self.start = start
+        self.end = end
+        self.head = head
+        super().__init__(self._chunks(), status_code=status_code, headers=headers, media_type=media_type)
+
+    async def _chunks(self):
+        if self.head:
+            return
+        offset = self.start
+        while offset <= self.end:
+            size = min(self.server.chunk_size, self.end - offset + 1)
+            await self.server.limiter.throttle(self.client, size)
+            data = await asyncio.to_thread(os.pread, self.handle.fd, size, offset)
+            if not data:
+                break
+            offset += len(data)
+            yield data
+
+    async def _zerocopy(self, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        offset = self.start
+        while offset <= self.end:
+            count = min(self.server.chunk_size, self.end - offset + 1)
+            await self.server.limiter.throttle(self.client, count)
+            offset += count
+            await send({"type": ZEROCOPY_EXTENSION, "file": self.handle.file, "offset": offset - count,
+                        "count": count, "more_body": offset <= self.end})
+
+    async def __call__(self, scope, receive, send):
+        try:
+            if ZEROCOPY_EXTENSION in scope.get("extensions", {}) and not self.head and self.end >= self.start:
+                await self._zerocopy(send)
+            else:
+                await super().__call__(scope, receive, send)
+        finally:
+            self.server.limiter.close(self.client)
+            await asyncio.to_thread(self.server.handles.release, self.handle)
+
+
+class MediaServer:
+    """
+    Serves files with Range/If-Range, strong ETags and conditional
+    requests, reading through shared file handles under per-client
+    stream and bandwidth limits.
+    """
+
+    def __init__(self, handles: FileHandleCache = None, limiter: ClientLimiter = None,
+                 chunk_size: int = MEDIA_CHUNK_SIZE):
+        self.handles = handles or FileHandleCache()
+        self.limiter = limiter or ClientLimiter()
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def default_etag(stat: os.stat_result) -> str:
+        return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    @staticmethod
+    def _etag_matches(header: str, etag: str) -> bool:
+        return any(tag.strip() in (etag, "*") for tag in header.split(","))
+
+    async def response(self, request: Request, path: str, etag: str = None, media_type: str = None,
+                       headers: dict = None) -> Response:
+        """
+        Response for path. etag, when given, must be a strong validator of
+        the file's bytes (e.g. its content hash); by default it's derived
+        from inode, size and mtime.
+        """
+        try:
+            handle = await asyncio.to_thread(self.handles.acquire, path)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise HTTPException(status_code=404, detail="Not found")
+
+        try:
+            stat = handle.stat
+            size = stat.st_size
+            etag = f'"{etag}"' if etag else self.default_etag(stat)
+            last_modified = formatdate(stat.st_mtime, usegmt=True)
+            response_headers = {
+                "accept-ranges": "bytes",
+                "etag": etag,
+                "last-modified": last_modified,
+                **(headers or {}),
+            }
+            media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+            if_none_match = request.headers.get("if-none-match")
+            if if_none_match and self._etag_matches(if_none_match, etag):
+                await asyncio.to_thread(self.handles.release, handle)
+                return Response(status_code=304, headers=response_headers)
+
+            start, end, status = 0, size - 1, 200
+            range_header = request.headers.get("range")
+            if range_header and self._if_range_matches(request.headers.get("if-range"), etag, stat):
+                try:
+                    byte_range = parse_range(range_header, size)
+                except ValueError:
+                    await asyncio.to_thread(self.handles.release, handle)
+                    return Response(status_code=416, headers={**response_headers,
+                                                              "content-range": f"bytes */{size}"})
+                if byte_range is not None:
+                    start, end = byte_range
+                    status = 206
+                    response_headers["content-range"] = f"bytes {start}-{end}/{size}"
+            response_headers["content-length"] = str(end - start + 1)
+        except BaseException:
+            await asyncio.to_thread(self.handles.release, handle)
+            raise
+
+        client = request.client.host if request.client else "unknown"
+        if not self.limiter.open(client):
+            await asyncio.to_thread(self.handles.release, handle)
+            raise HTTPException(status_code=429, detail="Too many concurrent streams",
+                                headers={"Retry-After": "1"})
+        return MediaResponse(self, handle, client, start, end, status, response_headers, media_type,
+                             head=request.method == "HEAD")
+
+    @staticmethod
+    def _if_range_matches(if_range: Optional[str], etag: str, stat: os.stat_result) -> bool:
+        """A Range is honoured without If-Range, or when If-Range still matches the file."""
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            # If-Range requires strong comparison
+            return if_range == etag
+        try:
+            return int(parsedate_to_datetime(if_range).timestamp()) == int(stat.st_mtime)
+        except (TypeError, ValueError):
+            return False
+
+    def stats(self) -> dict:
+        return {
+            "open_files": self.handles.open_count(),
+            "max_open_files": self.handles.max_open,
+            "streams_per_client": self.limiter.stats(),
+            "max_streams_per_client": self.limiter.max_streams,
+            "client_bandwidth": self.limiter.bandwidth,
+        }
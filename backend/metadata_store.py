@@ -0,0 +1,127 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Optional
+
+METADATA_DB = os.getenv("METADATA_DB", "data/metadata.db")
+
+# Columns the library can be sorted by (also indexed)
+SORTABLE_COLUMNS = {"upload_time", "filename", "file_size", "duration"}
+
+
+class MetadataStore:
+    """
+    Persistent SQLite cache of ffprobe metadata, keyed by file_id.
+    Entries are validated against the file's mtime and size so a changed
+    file is re-probed instead of served stale.
+    """
+
+    def __init__(self, db_path: str = METADATA_DB):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                file_id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                filename TEXT,
+                file_size INTEGER,
+                mtime REAL,
+                upload_time TEXT,
+                duration REAL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        for column in SORTABLE_COLUMNS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_videos_{column} ON videos ({column})")
+        self._conn.commit()
+
+    def put(self, file_id: str, path: str, metadata: dict):
+        stats = os.stat(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO videos "
+                "(file_id, path, filename, file_size, mtime, upload_time, duration, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file_id,
+                    path,
+                    metadata.get('filename', os.path.basename(path)),
+                    stats.st_size,
+                    stats.st_mtime,
+                    metadata.get('upload_time', ''),
+                    metadata.get('duration', 0),
+                    json.dumps(metadata),
+                ),
+            )
+            self._conn.commit()
+
+    def _row(self, file_id: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, file_size, mtime, metadata FROM videos WHERE file_id = ?", (file_id,)
+            ).fetchone()
+
+    def get(self, file_id: str) -> Optional[dict]:
+        """Cached metadata, or None when missing or the file changed on disk."""
+        row = self._row(file_id)
+        if row is None:
+            return None
+        path, file_size, mtime, metadata = row
+        try:
+            stats = os.stat(path)
+        except FileNotFoundError:
+            self.delete(file_id)
+            return None
+        if stats.st_size != file_size or stats.st_mtime != mtime:
+            return None
+        return json.loads(metadata)
+
+    def get_or_extract(self, file_id: str, path: str, extractor) -> dict:
+        """Cached metadata, probing the file with extractor on a miss."""
+        metadata = self.get(file_id)
+        if metadata is None:
+            metadata = extractor.extract_metadata(path)
+            metadata['file_id'] = file_id
+            metadata['path'] = path
+            self.put(file_id, path, metadata)
+        return metadata
+
+    def delete(self, file_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM videos WHERE file_id = ?", (file_id,))
+            self._conn.commit()
+
+    def list(self, limit: Optional[int] = None, offset: int = 0,
+             sort: str = "upload_time", order: str = "desc"):
+        """Returns (videos, total) with sorting and pagination done in SQLite."""
+        if sort not in SORTABLE_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort}")
+        direction = "ASC" if order.lower() == "asc" else "DESC"
+        query = f"SELECT metadata FROM videos ORDER BY {sort} {direction}"
+        params = []
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params = [limit, offset]
+        elif offset:
+            query += " LIMIT -1 OFFSET ?"
+            params = [offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            total = self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        return [json.loads(metadata) for (metadata,) in rows], total
+
+    def sync(self, files: dict, extractor):
+        """
+        Reconcile the store with the upload directory at startup:
+        probe new or changed files and drop entries whose file is gone.
+        files maps file_id to its upload path.
+        """
+        with self._lock:
+            known = {file_id for (file_id,) in self._conn.execute("SELECT file_id FROM videos")}
+        for file_id in known - set(files):
+            self.delete(file_id)
+        for file_id, path in files.items():
+            self.get_or_extract(file_id, path, extractor)
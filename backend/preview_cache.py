@@ -0,0 +1,155 @@
+import os
+import json
+import math
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+PREVIEW_DIR = os.getenv("PREVIEW_DIR", "data/previews")
+# Seconds between sprite thumbnails; widened for long videos so the
+# sprite never holds more than SPRITE_MAX_THUMBNAILS frames
+SPRITE_INTERVAL = float(os.getenv("SPRITE_INTERVAL", 2))
+SPRITE_MAX_THUMBNAILS = int(os.getenv("SPRITE_MAX_THUMBNAILS", 400))
+MAX_PARALLEL_PREVIEWS = int(os.getenv("MAX_PARALLEL_PREVIEWS", 2))
+
+THUMB_WIDTH = 160
+THUMB_HEIGHT = 90
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+POSTER_WIDTH = 640
+# The poster is taken a little way in, past fade-ins and black intros
+POSTER_MAX_OFFSET = 10.0
+
+MANIFEST = "manifest.json"
+VTT_NAME = "thumbnails.vtt"
+
+
+def _vtt_time(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+class PreviewCache:
+    """
+    Cache of poster frames and seek sprite sheets.
+
+    Each upload's previews live in cache_dir/<key>/ (see key()) with a
+    WebVTT index mapping time ranges to sprite tiles. Keys come from the
+    file_id and the file's mtime, so looking one up never reads the video
+    and a replaced source gets a new entry. Generation writes into a temp
+    dir that is renamed into place, so a half-written entry is never
+    served.
+    """
+
+    def __init__(self, cache_dir: str = PREVIEW_DIR, max_parallel: int = MAX_PARALLEL_PREVIEWS):
+        self.cache_dir = cache_dir
+        self._slots = threading.BoundedSemaphore(max(1, max_parallel))
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, file_id: str, video_path: str) -> str:
+        """Entry name of an upload, from its file_id and modification time."""
+        return f"{file_id}_{os.stat(video_path).st_mtime_ns}"
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> Optional[dict]:
+        """The entry's manifest, or None if previews haven't been generated."""
+        try:
+            with open(os.path.join(self.path_for(key), MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def ensure(self, video_path: str, key: str, duration: float, processor) -> Optional[dict]:
+        """Returns the manifest for key, generating previews on a miss."""
+        manifest = self.get(key)
+        if manifest is not None:
+            return manifest
+        if not duration or duration <= 0:
+            return None
+
+        # One generation per entry; concurrent requests wait and reuse it
+        with self._lock_for(key):
+            manifest = self.get(key)
+            if manifest is not None:
+                return manifest
+            with self._slots:
+                return self._generate(video_path, key, duration, processor)
+
+    def _generate(self, video_path: str, key: str, duration: float, processor) -> Optional[dict]:
+        interval = max(SPRITE_INTERVAL, duration / SPRITE_MAX_THUMBNAILS)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir)
+        try:
+            sheets = processor.generate_previews(
+                video_path, tmp_dir,
+                poster_time=min(duration * 0.1, POSTER_MAX_OFFSET),
+                interval=interval,
+                thumb_width=THUMB_WIDTH,
+                thumb_height=THUMB_HEIGHT,
+                columns=SPRITE_COLUMNS,
+                rows=SPRITE_ROWS,
+                poster_width=POSTER_WIDTH,
+            )
+            if not sheets or not os.path.exists(os.path.join(tmp_dir, "poster.jpg")):
+                return None
+
+            per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+            count = min(math.ceil(duration / interval), len(sheets) * per_sheet)
+            self._write_vtt(os.path.join(tmp_dir, VTT_NAME), sheets, count, interval, duration)
+            manifest = {
+                "key": key,
+                "interval": interval,
+                "thumbnails": count,
+                "thumb_width": THUMB_WIDTH,
+                "thumb_height": THUMB_HEIGHT,
+                "sprites": sheets,
+            }
+            with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+                json.dump(manifest, f)
+
+            # Drop a leftover entry without a manifest before swapping in the new one
+            shutil.rmtree(self.path_for(key), ignore_errors=True)
+            os.replace(tmp_dir, self.path_for(key))
+            return manifest
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _write_vtt(self, path: str, sheets: list, count: int, interval: float, duration: float):
+        """WebVTT cues pointing at each thumbnail's tile via a #xywh= fragment."""
+        per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+        lines = ["WEBVTT", ""]
+        for i in range(count):
+            start = i * interval
+            end = min((i + 1) * interval, duration)
+            tile = i % per_sheet
+            x = (tile % SPRITE_COLUMNS) * THUMB_WIDTH
+            y = (tile // SPRITE_COLUMNS) * THUMB_HEIGHT
+            lines.append(f"{_vtt_time(start)} --> {_vtt_time(end)}")
+            lines.append(f"{sheets[i // per_sheet]}#xywh={x},{y},{THUMB_WIDTH},{THUMB_HEIGHT}")
+            lines.append("")
+        with open(path, "w") as f:
+            f.write("\n".join(lines))
+
+    def file_path(self, key: str, name: str) -> Optional[str]:
+        """Path of a poster, sprite or VTT file in an entry, or None if it isn't one."""
+        manifest = self.get(key)
+        if manifest is None or name not in ("poster.jpg", VTT_NAME, *manifest["sprites"]):
+            return None
+        return os.path.join(self.path_for(key), name)
+
+    def entries(self, file_id: str) -> List[str]:
+        """Paths of every entry made for file_id, whichever mtime it was made from."""
+        prefix = f"{file_id}_"
+        return sorted(self.path_for(name) for name in os.listdir(self.cache_dir) if name.startswith(prefix))
+
+    def delete(self, key: str):
+        shutil.rmtree(self.path_for(key), ignore_errors=True)
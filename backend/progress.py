@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+# Minimum seconds between progress updates sent for one job
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", 1.0))
+
+
+def parse_progress_block(report: Dict[str, str]) -> tuple:
+    """
+    (out_seconds, fps, speed) from one ffmpeg -progress block. ffmpeg
+    prints "N/A" before the first frame, which maps to None.
+    """
+    out_seconds = None
+    for key, scale in (("out_time_us", 1e-6), ("out_time_ms", 1e-6)):
+        # out_time_ms is also in microseconds, for historical reasons
+        try:
+            out_seconds = max(0.0, int(report[key]) * scale)
+            break
+        except (KeyError, ValueError):
+            continue
+    try:
+        fps = float(report.get("fps", ""))
+    except ValueError:
+        fps = None
+    try:
+        speed = float(report.get("speed", "").rstrip("x"))
+    except ValueError:
+        speed = None
+    return out_seconds, fps, speed
+
+
+class JobProgress:
+    """
+    Aggregates the ffmpeg -progress reports of one job into throttled
+    updates with percent, throughput and ETA, and reports how long each
+    stage took.
+
+    A stage may run several ffmpeg processes at once (parallel cuts);
+    each reports under its own key and the stage's progress is the sum of
+    their output time against the stage's expected output duration.
+    Throughput (fps, speed) only sums processes that are still running.
+    """
+
+    def __init__(self, on_update: Callable[[dict], None],
+                 on_stage_finished: Optional[Callable[[str, float], None]] = None,
+                 interval: float = PROGRESS_INTERVAL):
+        self.on_update = on_update
+        self.on_stage_finished = on_stage_finished
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stage = None
+        self._total = 0.0
+        self._started = 0.0
+        self._last_emit = 0.0
+        self._reports: Dict[str, tuple] = {}
+
+    def stage_started(self, name: str, total_seconds: float):
+        with self._lock:
+            self._stage = name
+            self._total = max(0.0, total_seconds or 0.0)
+            self._started = time.monotonic()
+            self._reports = {}
+            update = self._snapshot()
+            self._last_emit = self._started
+        self.on_update(update)
+
+    def progress(self, key: str, out_seconds: Optional[float], fps: Optional[float], speed: Optional[float]):
+        with self._lock:
+            if self._stage is None:
+                return
+            previous = self._reports.get(key, (0.0, None, None))
+            self._reports[key] = (out_seconds if out_seconds is not None else previous[0], fps, speed)
+            now = time.monotonic()
+            if now - self._last_emit < self.interval:
+                return
+            self._last_emit = now
+            update = self._snapshot()
+        self.on_update(update)
+
+    def process_finished(self, key: str):
+        """
+        An ffmpeg process has exited: its output time still counts
+        towards the stage, but its fps and speed no longer add to the
+        stage's throughput and ETA.
+        """
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                self._reports[key] = (report[0], None, None)
+
+    def stage_finished(self, name: str):
+        with self._lock:
+            if self._stage != name:
+                return
+            elapsed = time.monotonic() - self._started
+            update = self._snapshot()
+            update["percent"] = 100.0
+            update["eta_seconds"] = 0.0
+            self._stage = None
+        self.on_update(update)
+        if self.on_stage_finished:
+            self.on_stage_finished(name, elapsed)
+
+    def _snapshot(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        done = sum(report[0] for report in self._reports.values())
+        fps = sum(report[1] for report in self._reports.values() if report[1])
+        speed = sum(report[2] for report in self._reports.values() if report[2])
+        total = self._total
+        percent = min(100.0, 100.0 * done / total) if total else None
+
+        eta = None
+        if total and done < total:
+            if speed:
+                eta = (total - done) / speed
+            elif done and elapsed:
+                eta = elapsed * (total - done) / done
+        return {
+            "stage": self._stage,
+            "percent": round(percent, 1) if percent is not None else None,
+            "processed_seconds": round(done, 2),
+            "total_seconds": round(total, 2),
+            "fps": round(fps, 1) if fps else None,
+            "speed": round(speed, 2) if speed else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(elapsed, 2),
+        }
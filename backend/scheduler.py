@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from job_executor import LaneStats, pick_group, SCHEDULER_AGING_RATE
+
+# Analysis jobs talking to Gemini at once; they mostly wait on the network,
+# so this lane is sized separately from the FFmpeg worker pool
+ANALYSIS_LANE_SLOTS = int(os.getenv("ANALYSIS_LANE_SLOTS", os.getenv("MAX_CONCURRENT_ANALYSES", 4)))
+
+REFERENCE_PIXELS = 1920 * 1080
+REFERENCE_BITRATE = 8_000_000
+# Estimated seconds of work per second of a 1080p, 8 Mbit/s source
+COST_PER_SECOND = {
+    "render": 0.5,     # libx264 'fast' re-encode
+    "proxy": 0.1,      # low-resolution, low-fps analysis proxy
+    "split": 0.02,     # stream-copied analysis chunks
+    "windows": 0.05,   # candidate windows cut from the proxy
+    "score": 0.05,     # signal scorer's decode passes
+    "previews": 0.05,  # poster and seek sprites from one decode
+    "analysis": 0.1,   # Gemini upload and processing
+}
+# Round trip of a Gemini request, however short the video
+ANALYSIS_BASE_COST = 20.0
+# Used when a source has no stored metadata
+DEFAULT_DURATION = 60.0
+
+
+def estimate_cost(kind: str, metadata: dict = None, seconds: float = None) -> float:
+    """
+    Estimated seconds a job of kind (a COST_PER_SECOND key) takes on the
+    source described by metadata (MetadataExtractor output). seconds is
+    how much of the source it touches, the whole duration by default.
+    Only the ordering matters, so rough factors are fine.
+    """
+    metadata = metadata or {}
+    if seconds is None:
+        seconds = metadata.get("duration") or DEFAULT_DURATION
+    if kind == "analysis":
+        # Gemini sees a proxy, so source resolution hardly matters
+        return ANALYSIS_BASE_COST + COST_PER_SECOND[kind] * seconds
+
+    pixels = (metadata.get("width") or 1920) * (metadata.get("height") or 1080)
+    bitrate = metadata.get("bitrate") or REFERENCE_BITRATE
+    # Encoding scales with resolution; decoding adds a share that grows with bitrate
+    scale = pixels / REFERENCE_PIXELS * (0.75 + 0.25 * min(4.0, bitrate / REFERENCE_BITRATE))
+    return COST_PER_SECOND[kind] * seconds * scale
+
+
+def estimate_render_cost(metadata: dict, highlights: list, renditions: int = 1,
+                         copy_original: bool = False) -> float:
+    """
+    Estimated seconds to render highlights followed by the original.
+    Extra renditions share one decode, so each adds half an encode.
+    """
+    seconds = sum(max(0.0, float(h['end']) - float(h['start'])) for h in highlights)
+    cost = estimate_cost("render", metadata, seconds)
+    if not copy_original:
+        cost += estimate_cost("render", metadata)
+    return cost * (1 + 0.5 * max(0, renditions - 1))
+
+
+class PriorityLane:
+    """
+    Admission control for async work that waits on remote services rather
+    than the CPU, such as Gemini analysis. At most `slots` jobs hold the
+    lane; waiters are admitted with JobExecutor's policy (cheapest first,
+    with aging), so a short clip isn't stuck behind hour-long uploads.
+    """
+
+    def __init__(self, slots: int = ANALYSIS_LANE_SLOTS, aging_rate: float = SCHEDULER_AGING_RATE):
+        self.slots = max(1, slots)
+        self.aging_rate = aging_rate
+        self._holders = set()
+        # key -> (cost, submitted, future), in arrival order for tie-breaks
+        self._waiters: "OrderedDict[str, tuple]" = OrderedDict()
+        self._usage = LaneStats(self.slots)
+
+    def has_capacity(self) -> bool:
+        return len(self._holders) < self.slots and not self._waiters
+
+    def _grant(self):
+        now = time.monotonic()
+        while self._waiters and len(self._holders) < self.slots:
+            key = pick_group(((key, cost, submitted) for key, (cost, submitted, _) in self._waiters.items()),
+                             self.aging_rate, now)
+            _, _, future = self._waiters.pop(key)
+            self._holders.add(key)
+            future.set_result(None)
+
+    def _release(self, key: str):
+        self._holders.discard(key)
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, key: str, cost: float = 0.0):
+        """Holds one slot of the lane for the duration of the block."""
+        submitted = time.monotonic()
+        if self.has_capacity():
+            self._holders.add(key)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[key] = (cost or 0.0, submitted, future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Cancelled while waiting, or just after being granted a slot
+                if self._waiters.pop(key, None) is None:
+                    self._release(key)
+                raise
+        self._usage.started(key, submitted)
+        try:
+            yield
+        finally:
+            self._usage.finished(key)
+            self._release(key)
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "running": len(self._holders),
+            "queued": len(self._waiters),
+            "queued_cost_seconds": round(sum(cost for cost, _, _ in self._waiters.values()), 1),
+            **self._usage.snapshot(submitted for _, submitted, _ in self._waiters.values()),
+        }
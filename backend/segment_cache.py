@@ -0,0 +1,96 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+SEGMENT_CACHE_DIR = os.getenv("SEGMENT_CACHE_DIR", "data/segments")
+SEGMENT_CACHE_MAX_MB = float(os.getenv("SEGMENT_CACHE_MAX_MB", 2048))
+
+
+def link_or_copy(src: str, dst: str):
+    """Hard-links src to dst, copying when they are on different filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class SegmentCache:
+    """
+    On-disk cache of rendered highlight clips, so re-submitting an edit
+    only re-encodes the clips whose boundaries changed.
+
+    Entries are keyed by the source's content hash, the clip's start and
+    end, and the parameters it was encoded with, and evicted
+    least-recently-used once the cache grows past max_mb. Hits are linked
+    (or copied) out of the cache, so eviction never pulls a clip out from
+    under a running concat.
+    """
+
+    def __init__(self, cache_dir: str = SEGMENT_CACHE_DIR, max_mb: float = SEGMENT_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, content_hash: str, start: float, end: float, params: dict) -> str:
+        digest = hashlib.sha256()
+        digest.update(content_hash.encode())
+        # Normalise so 5 and 5.0 from different clients share an entry
+        digest.update(f"\0{float(start):.3f}\0{float(end):.3f}\0".encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """Places the cached clip at output_path; False on a miss."""
+        path = self._entry_path(key)
+        try:
+            link_or_copy(path, output_path)
+        except FileNotFoundError:
+            return False
+        # Touch the entry so eviction is least-recently-used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def put(self, key: str, clip_path: str):
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            link_or_copy(clip_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error caching segment {clip_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".mp4"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stats = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stats.st_mtime, stats.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
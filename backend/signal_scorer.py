@@ -0,0 +1,278 @@
+import os
+import time
+import threading
+import ffmpeg
+import numpy as np
+from video_processor import VideoProcessor
+
+# Analysis resolution: tiny grayscale frames are plenty for motion and cuts
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 36
+FRAME_RATE = 4
+AUDIO_RATE = 8000
+HISTOGRAM_BINS = 16
+
+# Weights of the standardised features in the combined score
+LOUDNESS_WEIGHT = float(os.getenv("SCORE_LOUDNESS_WEIGHT", 1.0))
+MOTION_WEIGHT = float(os.getenv("SCORE_MOTION_WEIGHT", 0.7))
+SCENE_WEIGHT = float(os.getenv("SCORE_SCENE_WEIGHT", 0.5))
+
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    std = values.std()
+    if std == 0:
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+class SignalScorer:
+    """
+    Local highlight scoring from ffmpeg-extracted signals: scene-change
+    scores, audio loudness and a motion estimate. Frames and samples
+    come from a single ffmpeg decode and are reduced to per-second feature
+    arrays with NumPy, so memory stays flat for long videos and no
+    network is involved.
+
+    ffmpeg runs as a tracked process of processor, so cancelling the
+    job_id passed to find_highlights kills it like any other step.
+    """
+
+    def __init__(self, frame_rate: int = FRAME_RATE, processor: VideoProcessor = None):
+        self.frame_rate = frame_rate
+        self.processor = processor if processor is not None else VideoProcessor()
+
+    def _stream(self, stream, chunk_bytes: int, job_id: str = None, pass_fds: tuple = ()):
+        """
+        Yields ffmpeg's stdout in chunk_bytes reads while a thread drains
+        stderr, so a chatty decode can't fill the pipe and stall. Raises
+        ffmpeg.Error if ffmpeg exits with an error.
+        """
+        stream = stream.global_args('-nostats', '-loglevel', 'error')
+        stderr = []
+        with self.processor.tracked_process(stream, job_id, pass_fds) as process:
+            drain = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+            drain.start()
+            try:
+                while True:
+                    data = process.stdout.read(chunk_bytes)
+                    if not data:
+                        break
+                    yield data
+            finally:
+                process.stdout.close()
+                process.wait()
+                drain.join()
+        if process.returncode != 0:
+            raise ffmpeg.Error('ffmpeg', b"", stderr[0] if stderr else b"")
+
+    def _video_output(self, stream):
+        return stream.output('pipe:', format='rawvideo', pix_fmt='gray',
+                             vf=f"fps={self.frame_rate},scale={FRAME_WIDTH}:{FRAME_HEIGHT}")
+
+    def _frame_chunk_bytes(self) -> int:
+        return FRAME_WIDTH * FRAME_HEIGHT * self.frame_rate * 30
+
+    def _reduce_video(self, chunks):
+        """
+        Per-second motion (mean absolute frame difference) and scene-change
+        (grayscale histogram distance) arrays from raw gray frames.
+        """
+        frame_bytes = FRAME_WIDTH * FRAME_HEIGHT
+        motion, scene = [], []
+        previous_frame = None
+        previous_hist = None
+        pending = b""
+        for data in chunks:
+            pending += data
+            count = len(pending) // frame_bytes
+            if count == 0:
+                continue
+            frames = np.frombuffer(pending[:count * frame_bytes], dtype=np.uint8)
+            frames = frames.reshape(count, frame_bytes).astype(np.float32)
+            pending = pending[count * frame_bytes:]
+
+            # Histograms for all frames in the batch at once
+            bins = (frames * (HISTOGRAM_BINS / 256.0)).astype(np.int64)
+            offsets = np.arange(count)[:, None] * HISTOGRAM_BINS
+            hists = np.bincount((bins + offsets).ravel(), minlength=count * HISTOGRAM_BINS)
+            hists = hists.reshape(count, HISTOGRAM_BINS) / frame_bytes
+
+            if previous_frame is not None:
+                frames_with_prev = np.vstack([previous_frame, frames])
+                hists_with_prev = np.vstack([previous_hist, hists])
+            else:
+                frames_with_prev = np.vstack([frames[:1], frames])
+                hists_with_prev = np.vstack([hists[:1], hists])
+            motion.append(np.abs(np.diff(frames_with_prev, axis=0)).mean(axis=1) / 255.0)
+            scene.append(np.abs(np.diff(hists_with_prev, axis=0)).sum(axis=1) / 2.0)
+            previous_frame = frames[-1:]
+            previous_hist = hists[-1:]
+
+        if not motion:
+            return np.zeros(0), np.zeros(0)
+        motion = np.concatenate(motion)
+        scene = np.concatenate(scene)
+
+        # Reduce to per-second bins: average motion, strongest cut
+        seconds = len(motion) // self.frame_rate
+        if seconds == 0:
+            return np.zeros(0), np.zeros(0)
+        usable = seconds * self.frame_rate
+        motion = motion[:usable].reshape(seconds, self.frame_rate).mean(axis=1)
+        scene = scene[:usable].reshape(seconds, self.frame_rate).max(axis=1)
+        return motion, scene
+
+    def _reduce_audio(self, chunks) -> np.ndarray:
+        """Per-second RMS loudness in dBFS from mono s16le samples at AUDIO_RATE."""
+        second_bytes = AUDIO_RATE * 2
+        energies = []
+        pending = b""
+        for data in chunks:
+            pending += data
+            seconds = len(pending) // second_bytes
+            if seconds == 0:
+                continue
+            samples = np.frombuffer(pending[:seconds * second_bytes], dtype=np.int16).astype(np.float32) / 32768.0
+            pending = pending[seconds * second_bytes:]
+            energies.append(np.sqrt((samples.reshape(seconds, AUDIO_RATE) ** 2).mean(axis=1)))
+
+        if not energies:
+            return np.zeros(0)
+        rms = np.concatenate(energies)
+        return 20 * np.log10(np.maximum(rms, 1e-5))
+
+    def video_features(self, video_path: str, job_id: str = None):
+        """Per-second motion and scene-change arrays, in one decode pass."""
+        stream = self._video_output(ffmpeg.input(video_path))
+        return self._reduce_video(self._stream(stream, self._frame_chunk_bytes(), job_id))
+
+    def audio_loudness(self, video_path: str, job_id: str = None) -> np.ndarray:
+        """Per-second RMS loudness in dBFS of the downmixed audio track."""
+        stream = (
+            ffmpeg
+            .input(video_path)
+            .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=AUDIO_RATE)
+        )
+        return self._reduce_audio(self._stream(stream, AUDIO_RATE * 2 * 60, job_id))
+
+    def _has_audio(self, video_path: str) -> bool:
+        try:
+            return bool(ffmpeg.probe(video_path, select_streams='a').get('streams'))
+        except ffmpeg.Error:
+            return False
+
+    def features(self, video_path: str, job_id: str = None):
+        """
+        Motion, scene-change and loudness arrays from a single decode: one
+        ffmpeg process writes gray frames to stdout and PCM audio to a
+        second pipe, which a thread reduces as it arrives so neither pipe
+        fills up and stalls the other.
+        """
+        if not self._has_audio(video_path):
+            motion, scene = self.video_features(video_path, job_id)
+            return motion, scene, np.zeros(0)
+
+        read_fd, write_fd = os.pipe()
+        source = ffmpeg.input(video_path)
+        stream = ffmpeg.merge_outputs(
+            self._video_output(source['v:0']),
+            source['a:0'].output(f'pipe:{write_fd}', format='s16le', acodec='pcm_s16le', ac=1, ar=AUDIO_RATE),
+        )
+        audio = []
+
+        def read_audio():
+            with os.fdopen(read_fd, 'rb') as pipe:
+                chunks = iter(lambda: pipe.read(AUDIO_RATE * 2 * 60), b"")
+                try:
+                    audio.append(self._reduce_audio(chunks))
+                except Exception as e:
+                    print(f"No audio features for {video_path}: {e}")
+                    # Keep draining so ffmpeg never blocks on a full pipe
+                    for _ in chunks:
+                        pass
+
+        reader = threading.Thread(target=read_audio, daemon=True)
+        reader.start()
+        try:
+            motion, scene = self._reduce_video(
+                self._stream(stream, self._frame_chunk_bytes(), job_id, pass_fds=(write_fd,))
+            )
+        finally:
+            # ffmpeg has exited (or never started), so the audio pipe is at EOF
+            reader.join()
+        return motion, scene, audio[0] if audio else np.zeros(0)
+
+    def score(self, video_path: str, job_id: str = None) -> dict:
+        """Per-second feature arrays and the combined highlight score."""
+        motion, scene, loudness = self.features(video_path, job_id)
+
+        length = len(motion)
+        if len(loudness) == 0:
+            loudness = np.full(length, -90.0)
+        length = min(length, len(loudness))
+        motion, scene, loudness = motion[:length], scene[:length], loudness[:length]
+
+        combined = (
+            LOUDNESS_WEIGHT * _standardize(loudness)
+            + MOTION_WEIGHT * _standardize(motion)
+            + SCENE_WEIGHT * _standardize(scene)
+        )
+        return {"motion": motion, "scene": scene, "loudness": loudness, "score": combined}
+
+    def rank_segments(self, features: dict, window_seconds: int = 10, max_segments: int = 5,
+                      min_gap: int = 0) -> list:
+        """
+        Best non-overlapping windows by mean combined score, in timeline order.
+        """
+        score = features["score"]
+        if len(score) == 0:
+            return []
+        window = max(1, min(window_seconds, len(score)))
+        # Mean score of every window start, via a cumulative sum
+        cumulative = np.concatenate([[0.0], np.cumsum(score)])
+        window_scores = (cumulative[window:] - cumulative[:-window]) / window
+
+        loudness = _standardize(features["loudness"])
+        motion = _standardize(features["motion"])
+        taken = np.zeros(len(score), dtype=bool)
+        segments = []
+        for start in np.argsort(window_scores)[::-1]:
+            if len(segments) >= max_segments:
+                break
+            lo, hi = max(0, start - min_gap), min(len(score), start + window + min_gap)
+            if taken[lo:hi].any():
+                continue
+            taken[start:start + window] = True
+            segments.append(self._describe(
+                loudness, motion, features["scene"], int(start), int(start + window), float(window_scores[start])
+            ))
+        return sorted(segments, key=lambda s: s["start"])
+
+    def _describe(self, loudness: np.ndarray, motion: np.ndarray, scene: np.ndarray,
+                  start: int, end: int, score: float) -> dict:
+        """loudness and motion are standardised; scene is the raw histogram distance."""
+        traits = []
+        if loudness[start:end].mean() > 0.5:
+            traits.append("loud")
+        if motion[start:end].mean() > 0.5:
+            traits.append("high-motion")
+        if scene[start:end].max() > 0.4:
+            traits.append("scene change")
+        label = ", ".join(traits) if traits else "active"
+        return {
+            "start": start,
+            "end": end,
+            "description": f"Signal highlight ({label})",
+            "score": round(score, 3),
+        }
+
+    def find_highlights(self, video_path: str, window_seconds: int = 10, max_segments: int = 5,
+                        job_id: str = None) -> list:
+        """Offline highlight detection: features, then ranking."""
+        started = time.monotonic()
+        features = self.score(video_path, job_id)
+        highlights = self.rank_segments(features, window_seconds, max_segments)
+        elapsed = time.monotonic() - started
+        duration = len(features["score"])
+        print(f"Scored {duration}s of video in {elapsed:.1f}s ({duration / max(elapsed, 1e-6):.0f}x realtime)")
+        return highlights
@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from typing import List, Optional
+
+from job_executor import SCHEDULER_AGING_RATE
+
+WORK_QUEUE_DB = os.getenv("WORK_QUEUE_DB", "data/work_queue.db")
+# A leased task whose worker hasn't heartbeated for this long is handed out again
+WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", 60))
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", 3))
+# Delay before a failed task is retried; doubles with every attempt
+WORK_RETRY_DELAY = float(os.getenv("WORK_RETRY_DELAY", 30))
+# Relayed events are kept this long, for API processes that fall behind
+WORK_EVENT_RETENTION = float(os.getenv("WORK_EVENT_RETENTION", 3600))
+
+# Task states a task can still run from
+PENDING_STATES = ("queued", "leased")
+
+
+class WorkQueue:
+    """
+    Task queue shared by the API and worker processes through one SQLite
+    file, so scaling out needs no broker, only a shared disk.
+
+    Workers lease the cheapest waiting task (estimated cost less an
+    allowance for time waited, as in JobExecutor) and must heartbeat
+    before the lease runs out. A task whose worker died is leased again
+    once its lease expires, up to max_attempts in total. The same file
+    holds an event log: workers publish the log, progress and timeline
+    messages of their jobs and the API relays them to WebSocket clients.
+    """
+
+    def __init__(self, db_path: str = WORK_QUEUE_DB, lease_seconds: float = WORK_LEASE_SECONDS,
+                 max_attempts: int = WORK_MAX_ATTEMPTS, aging_rate: float = SCHEDULER_AGING_RATE):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.aging_rate = aging_rate
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                cost REAL NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                available_at REAL NOT NULL,
+                enqueued_at REAL NOT NULL,
+                finished_at REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks (state)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_job_id ON tasks (job_id)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def _transaction(self):
+        """BEGIN IMMEDIATE takes the write lock up front, so two workers can't lease one task."""
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def enqueue(self, job_id: str, kind: str, payload: dict, cost: float = 0.0) -> str:
+        task_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tasks (id, job_id, kind, payload, cost, state, max_attempts, available_at, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (task_id, job_id, kind, json.dumps(payload), cost or 0.0, self.max_attempts, now, now),
+            )
+        return task_id
+
+    def lease(self, worker: str, kinds: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        Claims the next runnable task for worker, or returns None. Tasks
+        whose lease expired count as a failed attempt of a crashed worker.
+        """
+        now = time.time()
+        kind_filter = f" AND kind IN ({', '.join('?' for _ in kinds)})" if kinds else ""
+        with self._lock:
+            self._transaction()
+            try:
+                self._expire_leases(now)
+                row = self._conn.execute(
+                    "SELECT id, job_id, kind, payload, attempts FROM tasks "
+                    "WHERE state = 'queued' AND available_at <= ? AND cancel_requested = 0" + kind_filter +
+                    " ORDER BY cost - ? * (? - enqueued_at), enqueued_at LIMIT 1",
+                    [now, *(kinds or []), self.aging_rate, now],
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                task_id, job_id, kind, payload, attempts = row
+                self._conn.execute(
+                    "UPDATE tasks SET state = 'leased', worker = ?, attempts = attempts + 1, lease_expires = ? "
+                    "WHERE id = ?",
+                    (worker, now + self.lease_seconds, task_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": task_id, "job_id": job_id, "kind": kind, "payload": json.loads(payload),
+                "attempt": attempts + 1}
+
+    def _expire_leases(self, now: float):
+        expired = self._conn.execute(
+            "SELECT id, attempts, max_attempts, cancel_requested FROM tasks "
+            "WHERE state = 'leased' AND lease_expires < ?", (now,)
+        ).fetchall()
+        for task_id, attempts, max_attempts, cancelled in expired:
+            if cancelled:
+                self._conn.execute(
+                    "UPDATE tasks SET state = 'cancelled', worker = NULL, finished_at = ? WHERE id = ?",
+                    (now, task_id),
+                )
+            elif attempts >= max_attempts:
+                self._conn.execute(
+                    "UPDATE tasks SET state = 'failed', worker = NULL, finished_at = ?, "
+                    "error = 'Worker lease expired' WHERE id = ?",
+                    (now, task_id),
+                )
+            else:
+                print(f"Lease of task {task_id} expired, requeueing")
+                self._conn.execute(
+                    "UPDATE tasks SET state = 'queued', worker = NULL, available_at = ? WHERE id = ?",
+                    (now, task_id),
+                )
+
+    def heartbeat(self, task_id: str, worker: str) -> bool:
+        """
+        Extends the lease. False means the worker must stop: the task was
+        cancelled, or its lease lapsed and it may be running elsewhere.
+        """
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE tasks SET lease_expires = ? "
+                "WHERE id = ? AND worker = ? AND state = 'leased' AND cancel_requested = 0",
+                (now + self.lease_seconds, task_id, worker),
+            ).rowcount
+        return updated == 1
+
+    def is_cancelled(self, task_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return bool(row and row[0])
+
+    def complete(self, task_id: str, worker: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = 'done', finished_at = ? WHERE id = ? AND worker = ?",
+                (time.time(), task_id, worker),
+            )
+
+    def fail(self, task_id: str, worker: str, error: str):
+        """Requeues the task with backoff, or fails it for good after max_attempts."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts, cancel_requested FROM tasks WHERE id = ? AND worker = ?",
+                (task_id, worker),
+            ).fetchone()
+            if row is None:
+                return
+            attempts, max_attempts, cancelled = row
+            if cancelled or attempts >= max_attempts:
+                self._conn.execute(
+                    "UPDATE tasks SET state = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                    (now, error, task_id),
+                )
+            else:
+                delay = WORK_RETRY_DELAY * 2 ** (attempts - 1)
+                self._conn.execute(
+                    "UPDATE tasks SET state = 'queued', worker = NULL, available_at = ?, error = ? WHERE id = ?",
+                    (now + delay, error, task_id),
+                )
+
+    def cancel(self, job_id: str) -> int:
+        """Drops a job's waiting tasks and flags leased ones; returns how many were affected."""
+        now = time.time()
+        with self._lock:
+            dropped = self._conn.execute(
+                "UPDATE tasks SET state = 'cancelled', finished_at = ? WHERE job_id = ? AND state = 'queued'",
+                (now, job_id),
+            ).rowcount
+            flagged = self._conn.execute(
+                "UPDATE tasks SET cancel_requested = 1 WHERE job_id = ? AND state = 'leased'", (job_id,)
+            ).rowcount
+        return dropped + flagged
+
+    def state(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def has_pending(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM tasks WHERE job_id = ? AND state IN (?, ?) LIMIT 1", (job_id, *PENDING_STATES)
+            ).fetchone()
+        return row is not None
+
+    def queued_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tasks WHERE state = 'queued'").fetchone()[0]
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """
+        0 while a worker holds the job's task, its 1-based place in lease
+        order while queued, None if it has no pending task.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, state FROM tasks WHERE state IN (?, ?) AND cancel_requested = 0 "
+                "ORDER BY state = 'queued', cost - ? * (? - enqueued_at), enqueued_at",
+                (*PENDING_STATES, self.aging_rate, now),
+            ).fetchall()
+        position = 0
+        for task_job_id, state in rows:
+            if state == "queued":
+                position += 1
+            if task_job_id == job_id:
+                return position
+        return None
+
+    def publish(self, events: List[tuple]):
+        """Appends (job_id, message) events to the log."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO events (job_id, message, created_at) VALUES (?, ?, ?)",
+                [(job_id, json.dumps(message), now) for job_id, message in events],
+            )
+
+    def last_event_id(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def events_since(self, event_id: int, limit: int = 500) -> List[tuple]:
+        """(id, job_id, message) of events after event_id, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, job_id, message FROM events WHERE id > ? ORDER BY id LIMIT ?", (event_id, limit)
+            ).fetchall()
+        return [(row_id, job_id, json.loads(message)) for row_id, job_id, message in rows]
+
+    def prune(self, retention: float = WORK_EVENT_RETENTION) -> int:
+        """Deletes relayed events and finished tasks older than retention seconds."""
+        cutoff = time.time() - retention
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM events WHERE created_at < ?", (cutoff,)).rowcount
+            removed += self._conn.execute(
+                "DELETE FROM tasks WHERE state NOT IN (?, ?) AND finished_at < ?", (*PENDING_STATES, cutoff)
+            ).rowcount
+        return removed
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            states = dict(self._conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+            workers = self._conn.execute(
+                "SELECT COUNT(DISTINCT worker) FROM tasks WHERE state = 'leased' AND lease_expires >= ?", (now,)
+            ).fetchone()[0]
+            retried = self._conn.execute("SELECT COUNT(*) FROM tasks WHERE attempts > 1").fetchone()[0]
+            oldest = self._conn.execute(
+                "SELECT MIN(enqueued_at) FROM tasks WHERE state = 'queued'"
+            ).fetchone()[0]
+        return {
+            "tasks": states,
+            "busy_workers": workers,
+            "retried_tasks": retried,
+            "oldest_queued_seconds": round(now - oldest, 2) if oldest else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EventPublisher:
+    """
+    Stands in for ConnectionManager inside a worker process: broadcasts
+    are appended to the work queue's event log by a writer thread, in
+    order and in batches, for the API to relay.
+    """
+
+    def __init__(self, work_queue: WorkQueue):
+        self.work_queue = work_queue
+        self._pending: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="event-publisher", daemon=True)
+        self._writer.start()
+
+    async def broadcast(self, job_id: str, message: dict):
+        self._pending.put((job_id, message))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                events = [event for event in batch if event is not None]
+                if events:
+                    self.work_queue.publish(events)
+            except Exception as e:
+                print(f"Error publishing events: {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+            if None in batch:
+                return
+
+    def flush(self):
+        """Block until every broadcast so far is in the event log."""
+        self._pending.join()
+
+    def close(self):
+        self._pending.put(None)
+        self._writer.join(timeout=5)
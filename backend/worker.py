@@ -0,0 +1,141 @@
+"""
+Worker process for EXECUTION_MODE=queue: leases analysis and render
+tasks from the shared work queue and runs them with the same pipeline
+as the API process.
+
+    cd backend
+    EXECUTION_MODE=queue uvicorn main:app   # API, any number of processes
+    python worker.py --concurrency 2        # workers, any number of processes or hosts
+
+Workers need the API's working directory (uploads/, processed/, data/)
+on a shared disk. Logs, progress and timeline updates go to the work
+queue's event log and the API relays them to WebSocket clients. A worker
+heartbeats each task; if it dies, the task is retried elsewhere once
+its lease expires. SIGTERM stops leasing and lets running tasks finish.
+"""
+import os
+import signal
+import socket
+import asyncio
+import argparse
+
+import main
+from work_queue import WorkQueue, EventPublisher
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", main.job_executor.max_workers))
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 5))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 1))
+
+
+class Worker:
+    def __init__(self, work_queue: WorkQueue, worker_id: str, concurrency: int = WORKER_CONCURRENCY,
+                 kinds: list = None):
+        self.work_queue = work_queue
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.kinds = kinds
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        print(f"Worker {self.worker_id} stopping after its running tasks")
+        self._stopping.set()
+
+    async def _heartbeat(self, task: dict, runner: asyncio.Task):
+        while not runner.done():
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+            if runner.done():
+                return
+            if await asyncio.to_thread(self.work_queue.heartbeat, task["id"], self.worker_id):
+                # Pick up a status the API wrote, so the pipeline's cancelled checks see it
+                await asyncio.to_thread(main.job_store.refresh, task["job_id"])
+                continue
+            if await asyncio.to_thread(self.work_queue.is_cancelled, task["id"]):
+                print(f"Job {task['job_id']} was cancelled")
+                # As in the API's cancel_job: mark the job, then kill its ffmpeg work;
+                # the runner records the cancellation as it unwinds
+                main.job_store.update(task["job_id"], status="cancelled")
+                main.job_executor.cancel(task["job_id"])
+            else:
+                # The lease lapsed and the task may already run elsewhere, so
+                # stop without writing anything to the job
+                print(f"Lost lease on task {task['id']}, abandoning job {task['job_id']}")
+                runner.cancel()
+                main.job_executor.cancel(task["job_id"])
+            return
+
+    async def run_task(self, task: dict):
+        job_id = task["job_id"]
+        kind = task["kind"]
+        # Drop any copy of the job from an earlier task; the API may have changed it
+        await asyncio.to_thread(main.job_store.forget, job_id)
+        job = main.job_store.get(job_id)
+        if job is None:
+            await asyncio.to_thread(self.work_queue.fail, task["id"], self.worker_id, "Job not found")
+            return
+        if kind == "process" and task["attempt"] > 1 and job.get("highlights"):
+            # Analysis finished before the previous attempt died
+            kind = "render"
+
+        print(f"Worker {self.worker_id} running {kind} for job {job_id} (attempt {task['attempt']})")
+        runner = asyncio.create_task(main.run_pipeline(kind, job_id, task["payload"]["file_path"]))
+        heartbeat = asyncio.create_task(self._heartbeat(task, runner))
+        try:
+            await runner
+            await asyncio.to_thread(self.work_queue.complete, task["id"], self.worker_id)
+        except asyncio.CancelledError:
+            print(f"Abandoned task {task['id']}")
+        except Exception as e:
+            # The runners report job failures themselves; this is for crashes worth retrying
+            print(f"Task {task['id']} failed: {e}")
+            await asyncio.to_thread(self.work_queue.fail, task["id"], self.worker_id, str(e))
+        finally:
+            heartbeat.cancel()
+            await asyncio.to_thread(main.job_store.forget, job_id)
+
+    async def run(self):
+        print(f"Worker {self.worker_id} started with {self.concurrency} slots")
+        running = set()
+        while not self._stopping.is_set():
+            while len(running) < self.concurrency:
+                task = await asyncio.to_thread(self.work_queue.lease, self.worker_id, self.kinds)
+                if task is None:
+                    break
+                running.add(asyncio.create_task(self.run_task(task)))
+            stop = asyncio.create_task(self._stopping.wait())
+            done, _ = await asyncio.wait(running | {stop}, timeout=WORKER_POLL_INTERVAL,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+            running -= done
+        if running:
+            await asyncio.wait(running)
+
+
+def main_loop():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="tasks run at once")
+    parser.add_argument("--kinds", default=None,
+                        help=f"comma-separated task kinds to take ({', '.join(main.TASK_RUNNERS)}); all by default")
+    args = parser.parse_args()
+
+    work_queue = main.work_queue or WorkQueue()
+    publisher = EventPublisher(work_queue)
+    # Broadcasts from the pipeline go to the event log instead of WebSockets
+    main.manager = publisher
+    worker = Worker(work_queue, f"{socket.gethostname()}-{os.getpid()}", args.concurrency,
+                    args.kinds.split(",") if args.kinds else None)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+
+    try:
+        asyncio.run(run())
+    finally:
+        publisher.close()
+        main.job_store.close()
+
+
+if __name__ == "__main__":
+    main_loop()
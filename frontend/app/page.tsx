@@ -16,6 +16,7 @@ interface JobStatus {
   file_id: string;
   status: 'queued' | 'analyzing' | 'processing' | 'completed' | 'failed';
   output_url?: string;
+  hls_url?: string;
   error?: string;
   highlights?: any[];
   timeline?: any[];
@@ -239,10 +240,16 @@ export default function Home() {
 
                       <div className="aspect-video bg-black rounded-lg overflow-hidden border border-zinc-800">
                         <video
-                          src={`http://localhost:8000${status.output_url}`}
                           controls
+                          preload="metadata"
                           className="w-full h-full"
-                        />
+                        >
+                          {/* HLS starts playback after the first segment; players without HLS support fall back to the MP4 */}
+                          {status.hls_url && (
+                            <source src={`http://localhost:8000${status.hls_url}`} type="application/vnd.apple.mpegurl" />
+                          )}
+                          <source src={`http://localhost:8000${status.output_url}`} type="video/mp4" />
+                        </video>
                       </div>
 
                       <div className="flex gap-2">
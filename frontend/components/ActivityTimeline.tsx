@@ -26,8 +26,14 @@ export default function ActivityTimeline({ jobId, timeline }: ActivityTimelinePr
 
         ws.onmessage = (event) => {
             const data = JSON.parse(event.data);
-            if (data.type === 'timeline') {
-                setEvents(data.timeline);
+            const messages = data.type === 'bundle' ? data.messages : [data];
+            for (const message of messages) {
+                if (message.type === 'timeline') {
+                    setEvents(message.timeline);
+                } else if (message.type === 'timeline_event') {
+                    // Deltas carry their position, so a repeated one replaces rather than duplicates
+                    setEvents(prev => [...prev.slice(0, message.index), message.entry]);
+                }
             }
         };
 
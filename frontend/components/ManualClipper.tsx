@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useRef, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Button } from '@/components/ui/button';
 import { Play, Pause, Scissors, Trash2, Clock, CheckCircle } from 'lucide-react';
 import axios from 'axios';
@@ -11,6 +11,38 @@ interface Clip {
     description?: string;
 }
 
+interface Thumbnail {
+    start: number;
+    end: number;
+    url: string;
+    x: number;
+    y: number;
+    width: number;
+    height: number;
+}
+
+const API_URL = 'http://localhost:8000';
+
+const parseVttTime = (value: string) => {
+    const parts = value.trim().split(':').map(Number);
+    return parts.reduce((total, part) => total * 60 + part, 0);
+};
+
+// Seek sprite index: each cue points at a tile of a sprite sheet via #xywh=
+const parseThumbnailVtt = (text: string, baseUrl: string): Thumbnail[] => {
+    const thumbnails: Thumbnail[] = [];
+    const lines = text.split('\n');
+    for (let i = 0; i < lines.length - 1; i++) {
+        if (!lines[i].includes('-->')) continue;
+        const [start, end] = lines[i].split('-->').map(parseVttTime);
+        const [file, fragment] = lines[i + 1].trim().split('#xywh=');
+        if (!file || !fragment) continue;
+        const [x, y, width, height] = fragment.split(',').map(Number);
+        thumbnails.push({ start, end, url: `${baseUrl}/${file}`, x, y, width, height });
+    }
+    return thumbnails;
+};
+
 interface ManualClipperProps {
     fileId: string;
     videoUrl: string;
@@ -24,6 +56,41 @@ export default function ManualClipper({ fileId, videoUrl, onProcessingStart }: M
     const [endTime, setEndTime] = useState<number | null>(null);
     const [clips, setClips] = useState<Clip[]>([]);
     const [isPlaying, setIsPlaying] = useState(false);
+    const [duration, setDuration] = useState(0);
+    const [thumbnails, setThumbnails] = useState<Thumbnail[]>([]);
+    const [hoverTime, setHoverTime] = useState<number | null>(null);
+
+    useEffect(() => {
+        const spritesUrl = `${API_URL}/videos/${fileId}/sprites`;
+        let cancelled = false;
+        axios.get(`${spritesUrl}/thumbnails.vtt`, { responseType: 'text' })
+            .then((response) => {
+                if (!cancelled) setThumbnails(parseThumbnailVtt(response.data, spritesUrl));
+            })
+            .catch(() => {
+                // No sprites yet (or the video is too short); the scrub bar still seeks
+                if (!cancelled) setThumbnails([]);
+            });
+        return () => {
+            cancelled = true;
+        };
+    }, [fileId]);
+
+    const hoverThumbnail = hoverTime === null
+        ? undefined
+        : thumbnails.find((thumb) => hoverTime >= thumb.start && hoverTime < thumb.end) ?? thumbnails[thumbnails.length - 1];
+
+    const scrubTime = (event: React.MouseEvent<HTMLDivElement>) => {
+        const rect = event.currentTarget.getBoundingClientRect();
+        const fraction = Math.min(1, Math.max(0, (event.clientX - rect.left) / rect.width));
+        return fraction * duration;
+    };
+
+    const handleScrub = (event: React.MouseEvent<HTMLDivElement>) => {
+        if (videoRef.current && duration) {
+            videoRef.current.currentTime = scrubTime(event);
+        }
+    };
 
     const handleTimeUpdate = () => {
         if (videoRef.current) {
@@ -90,7 +157,7 @@ export default function ManualClipper({ fileId, videoUrl, onProcessingStart }: M
         if (clips.length === 0) return;
 
         try {
-            const response = await axios.post(`http://localhost:8000/process/manual/${fileId}`, {
+            const response = await axios.post(`${API_URL}/process/manual/${fileId}`, {
                 clips: clips
             });
             onProcessingStart(response.data.id);
@@ -108,13 +175,59 @@ export default function ManualClipper({ fileId, videoUrl, onProcessingStart }: M
                         <video
                             ref={videoRef}
                             src={videoUrl}
+                            poster={`${API_URL}/videos/${fileId}/poster`}
+                            preload="metadata"
                             className="w-full h-full"
                             controls
                             playsInline
                             onTimeUpdate={handleTimeUpdate}
+                            onLoadedMetadata={() => setDuration(videoRef.current?.duration || 0)}
                         />
                     </div>
 
+                    {/* Scrub bar with seek thumbnails */}
+                    <div
+                        className="relative h-3 bg-zinc-800 rounded-full cursor-pointer"
+                        onMouseMove={(event) => duration && setHoverTime(scrubTime(event))}
+                        onMouseLeave={() => setHoverTime(null)}
+                        onClick={handleScrub}
+                    >
+                        <div
+                            className="absolute inset-y-0 left-0 bg-blue-600 rounded-full"
+                            style={{ width: duration ? `${(currentTime / duration) * 100}%` : 0 }}
+                        />
+                        {startTime !== null && duration > 0 && (
+                            <div
+                                className="absolute inset-y-0 bg-blue-400/40"
+                                style={{
+                                    left: `${(startTime / duration) * 100}%`,
+                                    width: `${(Math.max(0, (endTime ?? currentTime) - startTime) / duration) * 100}%`,
+                                }}
+                            />
+                        )}
+                        {hoverTime !== null && duration > 0 && (
+                            <div
+                                className="absolute bottom-5 -translate-x-1/2 pointer-events-none flex flex-col items-center gap-1"
+                                style={{ left: `${(hoverTime / duration) * 100}%` }}
+                            >
+                                {hoverThumbnail && (
+                                    <div
+                                        className="rounded border border-zinc-700 shadow-lg"
+                                        style={{
+                                            width: hoverThumbnail.width,
+                                            height: hoverThumbnail.height,
+                                            backgroundImage: `url(${hoverThumbnail.url})`,
+                                            backgroundPosition: `-${hoverThumbnail.x}px -${hoverThumbnail.y}px`,
+                                        }}
+                                    />
+                                )}
+                                <span className="text-xs text-zinc-300 font-mono bg-black/70 px-1 rounded">
+                                    {formatTime(hoverTime)}
+                                </span>
+                            </div>
+                        )}
+                    </div>
+
                     {/* Clipping Controls */}
                     <div className="grid grid-cols-3 gap-4">
                         <Button
@@ -10,6 +10,14 @@ interface LogEntry {
     timestamp: string;
 }
 
+interface ProgressUpdate {
+    type: 'progress';
+    stage: string;
+    percent: number | null;
+    speed: number | null;
+    eta_seconds: number | null;
+}
+
 interface ProcessingLogsProps {
     jobId: string;
 }
@@ -17,6 +25,7 @@ interface ProcessingLogsProps {
 export default function ProcessingLogs({ jobId }: ProcessingLogsProps) {
     const [logs, setLogs] = React.useState<LogEntry[]>([]);
     const [connected, setConnected] = React.useState(false);
+    const [progress, setProgress] = React.useState<ProgressUpdate | null>(null);
     const logsEndRef = useRef<HTMLDivElement>(null);
     const wsRef = useRef<WebSocket | null>(null);
 
@@ -51,8 +60,15 @@ export default function ProcessingLogs({ jobId }: ProcessingLogsProps) {
                 if (!isMounted) return;
                 try {
                     const data = JSON.parse(event.data);
-                    if (data.type === 'log') {
-                        setLogs(prev => [...prev, data]);
+                    // Bursts arrive as one bundle frame
+                    const messages = data.type === 'bundle' ? data.messages : [data];
+                    const newLogs = messages.filter((message: any) => message.type === 'log');
+                    if (newLogs.length > 0) {
+                        setLogs(prev => [...prev, ...newLogs]);
+                    }
+                    const updates = messages.filter((message: any) => message.type === 'progress');
+                    if (updates.length > 0) {
+                        setProgress(updates[updates.length - 1]);
                     }
                 } catch (e) {
                     console.error('Failed to parse WebSocket message:', e);
@@ -129,6 +145,20 @@ export default function ProcessingLogs({ jobId }: ProcessingLogsProps) {
                     <span className="text-xs text-zinc-500">{connected ? 'Connected' : 'Disconnected'}</span>
                 </div>
             </div>
+            {progress && progress.percent !== null && (
+                <div className="px-4 py-2 border-b border-zinc-800 space-y-1">
+                    <div className="flex justify-between text-xs text-zinc-400">
+                        <span className="capitalize">{progress.stage}: {progress.percent.toFixed(0)}%</span>
+                        <span>
+                            {progress.speed ? `${progress.speed}x` : ''}
+                            {progress.eta_seconds ? ` · ETA ${Math.ceil(progress.eta_seconds)}s` : ''}
+                        </span>
+                    </div>
+                    <div className="h-1 bg-zinc-800 rounded-full overflow-hidden">
+                        <div className="h-full bg-blue-500 transition-all" style={{ width: `${progress.percent}%` }} />
+                    </div>
+                </div>
+            )}
             <div className="p-4 font-mono text-xs max-h-96 overflow-y-auto bg-black/20">
                 {logs.length === 0 ? (
                     <div className="text-zinc-600 text-center py-8">Waiting for logs...</div>
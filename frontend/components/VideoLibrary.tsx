@@ -101,6 +101,12 @@ export default function VideoLibrary({ onVideoSelect, refreshTrigger }: VideoLib
                                 key={video.file_id}
                                 className="bg-zinc-900/50 border border-zinc-800 rounded-lg p-4 hover:border-zinc-700 transition-colors"
                             >
+                                <img
+                                    src={`http://localhost:8000/videos/${video.file_id}/poster`}
+                                    alt={video.filename}
+                                    loading="lazy"
+                                    className="w-full aspect-video object-cover bg-black rounded-md mb-3"
+                                />
                                 <div className="flex items-start justify-between mb-3">
                                     <div className="flex-1 min-w-0">
                                         <h3 className="text-sm font-medium text-zinc-200 truncate">